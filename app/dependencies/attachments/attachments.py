@@ -0,0 +1,142 @@
+import base64
+import hashlib
+import os
+import re
+import tempfile
+import threading
+from typing import BinaryIO, Optional, Tuple
+from dependencies.config import config
+
+_SHA256 = re.compile(r'^[0-9a-f]{64}$')
+
+# Input bytes per base64 line, as written by email.encoders.encode_base64.
+_LINE_BYTES  = 57
+_CHUNK_BYTES = _LINE_BYTES * 1024
+
+class AttachmentTooLarge(Exception):
+    """
+    The file is bigger than the whole store.
+    """
+
+class AttachmentStore:
+    """
+    Attachments stored on disk by the SHA-256 of their content, already
+    encoded as base64 MIME payloads, in one folder per owner account so that
+    accounts never see each other's files. The least recently used attachments
+    are evicted once the store grows beyond `max_bytes`.
+    """
+
+    def __init__(self, directory: str, max_bytes: int) -> None:
+        """
+        Parameters:
+        -----------
+        directory: str
+            Store directory. Created on the first upload.
+        max_bytes: int
+            Maximum total size of the stored payloads.
+
+        Return:
+        -------
+        None
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock     = threading.Lock()
+
+    def _folder(self, owner: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(owner.encode('utf-8')).hexdigest())
+
+    def _path(self, owner: str, sha256: str) -> str:
+        return os.path.join(self._folder(owner), f'{sha256}.b64')
+
+    def put(self, file: BinaryIO, owner: str) -> Tuple[str, int]:
+        """ Store a file, hashing and encoding it chunk by chunk. Files whose payload
+        is bigger than `max_bytes` raise AttachmentTooLarge.
+
+        Parameters:
+        -----------
+        file: BinaryIO
+            File to be stored.
+        owner: str
+            Identity of the uploading account.
+
+        Return:
+        -------
+        sha256, size: Tuple[str, int]
+            SHA-256 hex digest and size in bytes of the file.
+        """
+        folder = self._folder(owner)
+        os.makedirs(folder, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        written = 0
+        fd, temp_path = tempfile.mkstemp(dir=folder, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as temp:
+                while True:
+                    chunk = file.read(_CHUNK_BYTES)
+                    # Chunks are multiples of whole base64 lines, except the last one.
+                    while chunk and len(chunk) % _LINE_BYTES:
+                        more = file.read(_LINE_BYTES - len(chunk) % _LINE_BYTES)
+                        if not more:
+                            break
+                        chunk += more
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    size += len(chunk)
+                    payload = base64.encodebytes(chunk)
+                    written += len(payload)
+                    if written > self.max_bytes:
+                        raise AttachmentTooLarge(f'Attachments are limited to {self.max_bytes} '
+                                                 'bytes once base64 encoded.')
+                    temp.write(payload)
+            sha256 = digest.hexdigest()
+            path = self._path(owner, sha256)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        self._evict(keep=path)
+        return sha256, size
+
+    def get(self, sha256: str, owner: str) -> Optional[str]:
+        """ Base64 payload of a file stored by `owner`, or None when it is not in
+        the store. Reading an attachment marks it as recently used.
+        """
+        if not _SHA256.match(sha256):
+            return None
+        path = self._path(owner, sha256)
+        try:
+            with open(path) as fd:
+                payload = fd.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return payload
+
+    def _evict(self, keep: str) -> None:
+        """ Remove the least recently used files beyond `max_bytes`, except `keep`.
+        """
+        with self._lock:
+            entries = []
+            for folder in os.scandir(self.directory):
+                if not folder.is_dir():
+                    continue
+                for entry in os.scandir(folder.path):
+                    if entry.name.endswith('.b64'):
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                if path == keep:
+                    continue
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+store = AttachmentStore(config.ATTACHMENTS_DIR, config.ATTACHMENTS_MAX_BYTES)
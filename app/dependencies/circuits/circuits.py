@@ -0,0 +1,107 @@
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+from dependencies.config import config
+
+class CircuitOpen(Exception):
+    """
+    Calls to a mail server are refused after repeated timeouts.
+    """
+
+    def __init__(self, host: str, retry_after: float) -> None:
+        super().__init__(f'{host} is not answering, requests to it are suspended '
+                         f'for {retry_after:.0f} seconds.')
+        self.host        = host
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    """
+    Circuit breaker of a mail server. It opens after `threshold` timeouts within
+    `cooldown` seconds, refusing calls for `cooldown` seconds. Calls are then let
+    through again: the first operation completed closes the circuit, the first
+    timeout opens it again.
+    """
+
+    def __init__(self, host: str, threshold: int, cooldown: float) -> None:
+        """
+        Parameters:
+        -----------
+        host: str
+            Server address and port, for the error messages.
+        threshold: int
+            Timeouts within `cooldown` seconds opening the circuit.
+        cooldown: float
+            Seconds during which an open circuit refuses calls.
+
+        Return:
+        -------
+        None
+        """
+        self.host       = host
+        self.threshold  = threshold
+        self.cooldown   = cooldown
+        self._failures  : Deque[float] = deque()
+        self._opened_at : Optional[float] = None
+        self._lock      = threading.Lock()
+
+    @property
+    def open(self) -> bool:
+        opened_at = self._opened_at
+        return opened_at is not None and time.monotonic() < opened_at + self.cooldown
+
+    def check(self) -> None:
+        """ Raise CircuitOpen if calls to the server are refused.
+        """
+        opened_at = self._opened_at
+        if opened_at is not None:
+            retry_after = opened_at + self.cooldown - time.monotonic()
+            if retry_after > 0:
+                raise CircuitOpen(self.host, max(retry_after, 1.0))
+
+    def success(self) -> None:
+        """ An operation with the server completed.
+        """
+        if self._opened_at is not None and not self.open:
+            with self._lock:
+                self._opened_at = None
+                self._failures.clear()
+
+    def failure(self) -> None:
+        """ The server did not answer within its timeout.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._failures.append(now)
+            while self._failures[0] < now - self.cooldown:
+                self._failures.popleft()
+            if self._opened_at is not None or len(self._failures) >= self.threshold:
+                self._opened_at = now
+
+class Circuits:
+    """
+    Circuit breakers of the mail servers, by address and port.
+    """
+
+    def __init__(self, threshold: int, cooldown: float) -> None:
+        self.threshold = threshold
+        self.cooldown  = cooldown
+        self._breakers : Dict[Tuple[str, str], CircuitBreaker] = {}
+        self._lock     = threading.Lock()
+
+    def get(self, host: str, port: int|str) -> CircuitBreaker:
+        """ Circuit breaker of a server, created on first use.
+        """
+        key = (host, str(port))
+        with self._lock:
+            if key not in self._breakers:
+                self._breakers[key] = CircuitBreaker(f'{host}:{port}', self.threshold, self.cooldown)
+            return self._breakers[key]
+
+    def metrics(self) -> Dict[str, List[str]]:
+        """ Servers whose circuit is open.
+        """
+        with self._lock:
+            return {'open': sorted(breaker.host for breaker in self._breakers.values() if breaker.open)}
+
+circuits = Circuits(config.CIRCUIT_THRESHOLD, config.CIRCUIT_COOLDOWN)
@@ -0,0 +1,145 @@
+import functools
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+from dependencies.config import config
+from dependencies.deadlines import deadlines
+
+class _Call:
+    """
+    Upstream operation shared by identical requests.
+    """
+
+    def __init__(self) -> None:
+        self.done        = threading.Event()
+        self.result      = None
+        self.error       : Optional[BaseException] = None
+        self.finished_at : Optional[float] = None
+
+class SingleFlight:
+    """
+    Thread safe single-flight group: concurrent calls with the same key run the
+    operation once and share its result, which is also handed to the calls made
+    within `window` seconds after it completes. Errors are only shared with the
+    calls already waiting for them, and a call cancelled by its client is run
+    again by the calls that were waiting for it.
+    """
+
+    def __init__(self, window: float) -> None:
+        """
+        Parameters:
+        -----------
+        window: float
+            Seconds a result is reused after its operation completes. 0 only
+            shares operations still in flight.
+
+        Return:
+        -------
+        None
+        """
+        self.window   = window
+        self._calls   : Dict[Hashable, _Call] = {}
+        self._lock    = threading.Lock()
+        self._metrics = {'calls': 0, 'shared': 0}
+
+    def do(self, key: Hashable, function: Callable[[], Any]) -> Any:
+        """ Run `function`, unless an identical call is in flight or just completed.
+
+        Parameters:
+        -----------
+        key: Hashable
+            Identity of the operation.
+        function: Callable[[], Any]
+            The operation. Its result is shared, so callers must not modify it.
+
+        Return:
+        -------
+        result: Any
+            Result of the operation.
+        """
+        while True:
+            call, leader = self._join(key, function)
+            if leader or not isinstance(call.error, deadlines.Cancelled):
+                break
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def _join(self, key: Hashable, function: Callable[[], Any]) -> Tuple[_Call, bool]:
+        with self._lock:
+            self._purge()
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            self._metrics['calls'] += 1
+            if not leader:
+                self._metrics['shared'] += 1
+
+        if leader:
+            try:
+                call.result = function()
+            except BaseException as error:
+                call.error = error
+            call.finished_at = time.monotonic()
+            if call.error is not None or self.window <= 0:
+                with self._lock:
+                    if self._calls.get(key) is call:
+                        del self._calls[key]
+            call.done.set()
+        elif not call.done.wait(deadlines.remaining()):
+            raise deadlines.DeadlineExceeded('The request deadline was exceeded.')
+        return call, leader
+
+    def _purge(self) -> None:
+        now = time.monotonic()
+        expired = [key for key, call in self._calls.items()
+                       if call.finished_at is not None and now - call.finished_at >= self.window]
+        for key in expired:
+            del self._calls[key]
+
+    def forget(self, match: Callable[[Hashable], bool]) -> None:
+        """ Stop sharing the operations whose key matches, in flight or completed:
+        the calls already waiting get their result, later calls run again.
+        """
+        with self._lock:
+            for key in [key for key in self._calls if match(key)]:
+                del self._calls[key]
+
+    def metrics(self) -> Dict[str, int]:
+        """ Calls made since startup, and how many of them shared another call's operation.
+        """
+        with self._lock:
+            return dict(self._metrics)
+
+def _freeze(value: Any) -> Hashable:
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+def coalesced(method: Callable) -> Callable:
+    """ Decorator of `email` read methods: identical calls for the same account,
+    same method and same arguments share one IMAP operation through `flights`.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        key = (self.account, method.__name__, _freeze(args), _freeze(kwargs))
+        return flights.do(key, lambda: method(self, *args, **kwargs))
+    return wrapper
+
+def invalidates(method: Callable) -> Callable:
+    """ Decorator of `email` write methods: once they return or fail, the reads
+    of the account shared through `flights` are run again, as mailboxes and
+    messages, and their sequence numbers, may have changed.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            flights.forget(lambda key: key[0] == self.account)
+    return wrapper
+
+flights = SingleFlight(config.COALESCE_WINDOW)
@@ -0,0 +1,151 @@
+import zlib
+from typing import Dict, Optional
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+_metrics: Dict[str, int] = {
+    'responses_compressed': 0,
+    'bytes_in'            : 0,
+    'bytes_out'           : 0,
+}
+
+def compression_metrics() -> Dict[str, int]:
+    """ Counters of the HTTP response compression since startup.
+
+    Return:
+    -------
+    metrics: Dict[str, int]
+        Compressed responses count, bytes before and after compression, and bytes saved.
+    """
+    metrics = dict(_metrics)
+    metrics['bytes_saved'] = metrics['bytes_in'] - metrics['bytes_out']
+    return metrics
+
+def accepted_encoding(accept_encoding: str) -> Optional[str]:
+    """ Pick the content encoding from an Accept-Encoding header: 'br' when the
+    brotli package is installed and the client takes it, else 'gzip', else None.
+    """
+    accepted = set()
+    for item in accept_encoding.split(','):
+        name, *params = [value.strip() for value in item.split(';')]
+        q = 1.0
+        for param in params:
+            if param.startswith('q='):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if q > 0:
+            accepted.add(name.lower())
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+class _Compressor:
+    """
+    Incremental gzip or brotli compressor.
+    """
+
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int) -> None:
+        self.encoding = encoding
+        if encoding == 'br':
+            self._compressor = brotli.Compressor(quality=brotli_quality)
+        else:
+            self._compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes, last: bool) -> bytes:
+        """ Compress a body chunk. Chunks of a streamed body are flushed so
+        the client can decode them as they arrive.
+        """
+        if self.encoding == 'br':
+            data = self._compressor.process(data)
+            return data + (self._compressor.finish() if last else self._compressor.flush())
+        data = self._compressor.compress(data)
+        return data + self._compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing response bodies with gzip or brotli.
+
+    Bodies are compressed only from `minimum_size` bytes on: the first chunks
+    of a streamed body are held until they reach that size or the stream ends,
+    then the rest is compressed chunk by chunk. Responses that already carry a
+    Content-Encoding are left untouched.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024,
+                 gzip_level: int = 6, brotli_quality: int = 4) -> None:
+        self.app            = app
+        self.minimum_size   = minimum_size
+        self.gzip_level     = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        encoding = accepted_encoding(Headers(scope=scope).get('accept-encoding', ''))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[Message] = None
+        compressor: Optional[_Compressor] = None
+        passthrough = False
+        pending = bytearray()
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start, compressor, passthrough, pending
+            if message['type'] == 'http.response.start':
+                start = message
+                return
+            if passthrough or message['type'] != 'http.response.body':
+                if start is not None:
+                    await send(start)
+                    start = None
+                if pending:
+                    await send({'type': 'http.response.body', 'body': bytes(pending), 'more_body': True})
+                    pending = bytearray()
+                passthrough = True
+                await send(message)
+                return
+
+            body = message.get('body', b'')
+            more = message.get('more_body', False)
+            if compressor is None:
+                headers = MutableHeaders(raw=start['headers'])
+                if 'content-encoding' in headers:
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                pending += body
+                if more and len(pending) < self.minimum_size:
+                    return
+                body, pending = bytes(pending), bytearray()
+                if not more and len(body) < self.minimum_size:
+                    passthrough = True
+                    await send(start)
+                    await send({'type': 'http.response.body', 'body': body, 'more_body': False})
+                    return
+                compressor = _Compressor(encoding, self.gzip_level, self.brotli_quality)
+                del headers['content-length']
+                headers['content-encoding'] = encoding
+                headers.add_vary_header('accept-encoding')
+                await send(start)
+
+            data = compressor.compress(body, last=not more)
+            _metrics['bytes_in']  += len(body)
+            _metrics['bytes_out'] += len(data)
+            if not more:
+                _metrics['responses_compressed'] += 1
+            await send({'type': 'http.response.body', 'body': data, 'more_body': more})
+
+        await self.app(scope, receive, send_compressed)
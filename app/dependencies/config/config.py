@@ -0,0 +1,63 @@
+""" Service settings, read from environment variables at startup.
+"""
+import os
+import tempfile
+
+def _bool(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+# IMAP COMPRESS=DEFLATE (RFC 4978), used when the server advertises it.
+IMAP_COMPRESS       : bool = _bool('EMAIL_API_IMAP_COMPRESS', True)
+IMAP_COMPRESS_LEVEL : int  = int(os.environ.get('EMAIL_API_IMAP_COMPRESS_LEVEL', 6))
+
+# HTTP response compression (gzip, and brotli when the brotli package is installed).
+HTTP_COMPRESS_MINIMUM_SIZE : int = int(os.environ.get('EMAIL_API_HTTP_COMPRESS_MINIMUM_SIZE', 1024))
+HTTP_GZIP_LEVEL            : int = int(os.environ.get('EMAIL_API_HTTP_GZIP_LEVEL', 6))
+HTTP_BROTLI_QUALITY        : int = int(os.environ.get('EMAIL_API_HTTP_BROTLI_QUALITY', 4))
+
+# Simultaneous IMAP connections of a cross-mailbox search.
+SEARCH_CONNECTIONS : int = int(os.environ.get('EMAIL_API_SEARCH_CONNECTIONS', 4))
+
+# Session tokens: default and maximum lifetime in seconds, and idle IMAP
+# connections kept open per session.
+SESSION_TTL        : int = int(os.environ.get('EMAIL_API_SESSION_TTL', 1800))
+SESSION_MAX_TTL    : int = int(os.environ.get('EMAIL_API_SESSION_MAX_TTL', 86400))
+SESSION_KEEP_ALIVE : int = int(os.environ.get('EMAIL_API_SESSION_KEEP_ALIVE', 2))
+
+# Content-addressed attachment store: directory and total size before the least
+# recently used attachments are evicted.
+ATTACHMENTS_DIR       : str = os.environ.get('EMAIL_API_ATTACHMENTS_DIR',
+                                os.path.join(tempfile.gettempdir(), 'email-api-attachments'))
+ATTACHMENTS_MAX_BYTES : int = int(os.environ.get('EMAIL_API_ATTACHMENTS_MAX_BYTES', 1024**3))
+
+# Size of the BDAT chunks (RFC 3030) messages are streamed in, when the SMTP server supports CHUNKING.
+SMTP_CHUNK_SIZE : int = int(os.environ.get('EMAIL_API_SMTP_CHUNK_SIZE', 262144))
+
+# Seconds the result of an IMAP read (mailboxes, message UIDs, message) is shared
+# with identical requests of the same account after it completes. Identical
+# requests in flight always share one operation.
+COALESCE_WINDOW : float = float(os.environ.get('EMAIL_API_COALESCE_WINDOW', 0.5))
+
+# Timeouts in seconds of each IMAP and SMTP command (and connection), and deadlines
+# of the HTTP requests, carried to the commands they run. Exports and imports get
+# the longer transfer deadline.
+IMAP_TIMEOUT      : float = float(os.environ.get('EMAIL_API_IMAP_TIMEOUT', 30))
+SMTP_TIMEOUT      : float = float(os.environ.get('EMAIL_API_SMTP_TIMEOUT', 30))
+REQUEST_DEADLINE  : float = float(os.environ.get('EMAIL_API_REQUEST_DEADLINE', 60))
+TRANSFER_DEADLINE : float = float(os.environ.get('EMAIL_API_TRANSFER_DEADLINE', 3600))
+
+# Circuit breaker of each mail server: consecutive timeouts before requests to it
+# fail fast, and seconds before it is tried again.
+CIRCUIT_THRESHOLD : int   = int(os.environ.get('EMAIL_API_CIRCUIT_THRESHOLD', 5))
+CIRCUIT_COOLDOWN  : float = float(os.environ.get('EMAIL_API_CIRCUIT_COOLDOWN', 30))
+
+# Maximum bytes of the messages fetched by each FETCH of a mailbox export, which
+# imaplib holds in memory at once. Bigger messages are fetched one at a time.
+EXPORT_BATCH_BYTES : int = int(os.environ.get('EMAIL_API_EXPORT_BATCH_BYTES', 16 * 1024**2))
+
+# Maximum bytes of the messages sent by each APPEND of a mailbox import, which
+# are held in memory at once. Bigger messages are appended one at a time.
+IMPORT_BATCH_BYTES : int = int(os.environ.get('EMAIL_API_IMPORT_BATCH_BYTES', 16 * 1024**2))
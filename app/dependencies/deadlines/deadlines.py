@@ -0,0 +1,242 @@
+""" Request deadlines, carried to every IMAP and SMTP command run for the request,
+and cancelled when the HTTP client disconnects.
+"""
+import asyncio
+import contextvars
+import socket
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+class DeadlineExceeded(Exception):
+    """
+    The request deadline passed before an upstream command completed.
+    """
+
+class ServerTimeout(DeadlineExceeded):
+    """
+    A mail server did not answer within its command timeout.
+    """
+
+class Cancelled(Exception):
+    """
+    The HTTP client disconnected, the upstream work was abandoned.
+    """
+
+class Deadline:
+    """
+    Time limit of a request, and the callbacks interrupting its upstream
+    connections when it is cancelled.
+    """
+
+    def __init__(self, seconds: float) -> None:
+        """
+        Parameters:
+        -----------
+        seconds: float
+            Time left to the request.
+
+        Return:
+        -------
+        None
+        """
+        self.expires_at = time.monotonic() + seconds
+        self._cancelled = threading.Event()
+        self._callbacks : Dict[int, Callable[[], None]] = {}
+        self._lock      = threading.Lock()
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self) -> None:
+        """ Mark the request as cancelled and interrupt its connections.
+        """
+        self._cancelled.set()
+        with self._lock:
+            callbacks, self._callbacks = list(self._callbacks.values()), {}
+        for callback in callbacks:
+            try:
+                callback()
+            except OSError:
+                pass
+
+    def watch(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """ Call `callback` if the request is cancelled, until the returned function is called.
+        """
+        key = id(callback)
+        with self._lock:
+            self._callbacks[key] = callback
+        if self.cancelled:
+            self.cancel()
+
+        def unwatch() -> None:
+            with self._lock:
+                self._callbacks.pop(key, None)
+        return unwatch
+
+_current: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar('deadline', default=None)
+
+def current() -> Optional[Deadline]:
+    """ Deadline of the request being served, if any.
+    """
+    return _current.get()
+
+def remaining() -> Optional[float]:
+    """ Seconds left to the current deadline, or None without deadline.
+    """
+    deadline = _current.get()
+    return None if deadline is None else max(0.0, deadline.remaining())
+
+def watch(callback: Callable[[], None]) -> Callable[[], None]:
+    """ Call `callback` if the current request is cancelled, until the returned
+    function is called. Does nothing without deadline.
+    """
+    deadline = _current.get()
+    if deadline is None:
+        return lambda: None
+    return deadline.watch(callback)
+
+def timeout(limit: float) -> float:
+    """ Socket timeout of the next upstream operation: `limit`, shortened to the
+    time left to the current deadline.
+
+    Parameters:
+    -----------
+    limit: float
+        Command timeout of the server, in seconds.
+
+    Return:
+    -------
+    timeout: float
+        Timeout in seconds. Raises DeadlineExceeded when the deadline passed, and
+        Cancelled when the client disconnected.
+    """
+    deadline = _current.get()
+    if deadline is None:
+        return limit
+    if deadline.cancelled:
+        raise Cancelled('The client disconnected.')
+    left = deadline.remaining()
+    if left <= 0:
+        raise DeadlineExceeded('The request deadline was exceeded.')
+    return min(limit, left)
+
+def guarded(sock: socket.socket, host: str, limit: float, circuit: Any,
+            function: Callable, *args: Any) -> Any:
+    """ Run a blocking operation of a mail server connection under the current deadline.
+
+    Parameters:
+    -----------
+    sock: socket.socket
+        Socket of the connection, whose timeout is set for the operation.
+    host: str
+        Server name, for the error messages.
+    limit: float
+        Command timeout of the server, in seconds.
+    circuit: CircuitBreaker
+        Circuit breaker of the server, told of the timeouts, or None.
+    function: Callable
+        The operation, called with `args`.
+
+    Return:
+    -------
+    result: Any
+        Result of the operation. Timeouts are raised as ServerTimeout, or as
+        DeadlineExceeded when the request deadline cut the command timeout short;
+        errors and end of file of a cancelled request as Cancelled.
+    """
+    seconds = timeout(limit)
+    if sock is not None:
+        sock.settimeout(seconds)
+    try:
+        result = function(*args)
+    except Exception as error:
+        deadline = _current.get()
+        if deadline is not None and deadline.cancelled:
+            raise Cancelled('The client disconnected.') from error
+        if isinstance(error, TimeoutError) or isinstance(error.__context__, TimeoutError):
+            if seconds < limit:
+                raise DeadlineExceeded('The request deadline was exceeded while '
+                                       f'waiting for {host}.') from error
+            if circuit is not None:
+                circuit.failure()
+            raise ServerTimeout(f'{host} did not answer within {limit:g} seconds.') from error
+        raise
+    if result == b'':
+        # An interrupted socket reads as end of file, without error.
+        deadline = _current.get()
+        if deadline is not None and deadline.cancelled:
+            raise Cancelled('The client disconnected.')
+    return result
+
+class DeadlineMiddleware:
+    """
+    ASGI middleware giving each HTTP request a deadline, cancelled when the
+    client disconnects. Once the request body is read, the middleware is the
+    only reader of the client messages, and hands the disconnection to the app.
+    """
+
+    def __init__(self, app: ASGIApp, default: float, routes: Optional[Dict[str, float]] = None) -> None:
+        """
+        Parameters:
+        -----------
+        app: ASGIApp
+            Wrapped application.
+        default: float
+            Deadline of the requests, in seconds.
+        routes: Dict[str, float]
+            Deadlines of specific paths, in seconds.
+
+        Return:
+        -------
+        None
+        """
+        self.app     = app
+        self.default = default
+        self.routes  = routes or {}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        deadline = Deadline(self.routes.get(scope['path'], self.default))
+        disconnected = asyncio.Event()
+        watcher: Optional[asyncio.Task] = None
+
+        async def watch() -> None:
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    break
+            deadline.cancel()
+            disconnected.set()
+
+        async def receive_body() -> Message:
+            nonlocal watcher
+            if watcher is not None:
+                await disconnected.wait()
+                return {'type': 'http.disconnect'}
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                deadline.cancel()
+            elif not message.get('more_body', False):
+                watcher = asyncio.ensure_future(watch())
+            return message
+
+        token = _current.set(deadline)
+        try:
+            await self.app(scope, receive_body, send)
+        except Exception:
+            # The client is gone: the errors of the abandoned work have no one to go to.
+            if not deadline.cancelled:
+                raise
+        finally:
+            _current.reset(token)
+            if watcher is not None:
+                watcher.cancel()
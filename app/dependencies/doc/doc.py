@@ -1,7 +1,14 @@
+import argparse
 import json
+import pathlib
+from typing import Callable, Optional
 from fastapi import FastAPI
 
-def generate_documentation_HTML(app: FastAPI) -> None:
+APP_DIR      = pathlib.Path(__file__).resolve().parents[2]
+OPENAPI_PATH = APP_DIR / 'openapi.json'
+HTML_PATH    = APP_DIR.parent / 'index.html'
+
+def generate_documentation_HTML(app: FastAPI, path: str|pathlib.Path = "./index.html") -> None:
     HTML_TEMPLATE = """<!DOCTYPE html>
         <html>
         <head>
@@ -28,5 +35,50 @@ def generate_documentation_HTML(app: FastAPI) -> None:
         </body>
         </html>
         """
-    with open(f"./index.html", "w") as fd:
-        print(HTML_TEMPLATE % json.dumps(app.openapi()), file=fd)
\ No newline at end of file
+    with open(path, "w") as fd:
+        print(HTML_TEMPLATE % json.dumps(app.openapi()), file=fd)
+
+def generate_openapi_JSON(app: FastAPI, path: str|pathlib.Path = OPENAPI_PATH) -> None:
+    """ Write the OpenAPI schema of the app to a JSON file, so it can be
+    served at startup without being rebuilt.
+    """
+    with open(path, "w") as fd:
+        json.dump(app.openapi(), fd)
+
+def cached_openapi(app: FastAPI, path: str|pathlib.Path = OPENAPI_PATH) -> Callable[[], dict]:
+    """ Build a replacement for `app.openapi` that serves the prebuilt schema
+    at `path` when it exists, falling back to FastAPI's own generation otherwise.
+    The schema is read once and kept in `app.openapi_schema`.
+    """
+    generate = app.openapi
+
+    def openapi() -> dict:
+        if app.openapi_schema is None:
+            try:
+                with open(path) as fd:
+                    app.openapi_schema = json.load(fd)
+            except (OSError, ValueError):
+                return generate()
+        return app.openapi_schema
+
+    return openapi
+
+def main(argv: Optional[list] = None) -> None:
+    """ Build the documentation artifacts ahead of time, e.g. while building the
+    Docker image. Must be run from the `app` directory:
+
+        python -m dependencies.doc.doc [--html PATH] [--openapi PATH]
+    """
+    parser = argparse.ArgumentParser(description="Generate the API documentation artifacts.")
+    parser.add_argument('--html', default=HTML_PATH,
+                        help="Output path of the Redoc HTML page.")
+    parser.add_argument('--openapi', default=OPENAPI_PATH,
+                        help="Output path of the OpenAPI schema JSON.")
+    args = parser.parse_args(argv)
+
+    from main import app
+    generate_openapi_JSON(app, args.openapi)
+    generate_documentation_HTML(app, args.html)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+""" Streaming writers and readers of mailbox archives of raw RFC822 messages.
+"""
+import base64
+import json
+import re
+import tarfile
+import time
+from datetime import datetime, timezone
+from email.parser import BytesHeaderParser
+from email.utils import parsedate_to_datetime
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Tuple
+from dependencies.emails.imap import AppendMessage
+
+# Messages as yielded by email.export_messages: UID, internal date and raw bytes.
+RawMessage = Tuple[str, Optional[time.struct_time], bytes]
+
+_FROM_LINE   = re.compile(rb'^(>*From )', re.M)
+_QUOTED_FROM = re.compile(rb'^>(>*From )')
+
+# mbox Status and X-Status letters, and the IMAP flags they stand for.
+_STATUS_FLAGS = {'R': '\\Seen', 'A': '\\Answered', 'F': '\\Flagged', 'D': '\\Deleted', 'T': '\\Draft'}
+
+def mbox(messages: Iterable[RawMessage]) -> Iterator[bytes]:
+    """ Write messages in the mboxrd format: lines starting with 'From ', after
+    any number of '>', are quoted with one more '>'.
+
+    Parameters:
+    -----------
+    messages: Iterable[RawMessage]
+        Messages to be archived.
+
+    Return:
+    -------
+    chunks: Iterator[bytes]
+        The mbox file, one message at a time.
+    """
+    for _, date, raw in messages:
+        date = time.asctime(date if date is not None else time.gmtime(0))
+        body = _FROM_LINE.sub(rb'>\1', raw.replace(b'\r\n', b'\n'))
+        if not body.endswith(b'\n'):
+            body += b'\n'
+        yield b'From MAILER-DAEMON ' + date.encode('ascii') + b'\n' + body + b'\n'
+
+class _Buffer:
+    """
+    Write-only file object collecting what tarfile writes, to be yielded.
+    """
+
+    def __init__(self) -> None:
+        self.chunks = []
+
+    def write(self, data: bytes) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def take(self) -> bytes:
+        data, self.chunks = b''.join(self.chunks), []
+        return data
+
+class _Reader:
+    """
+    Minimal file object over bytes, for tarfile.addfile.
+    """
+
+    def __init__(self, data: bytes) -> None:
+        self._data = memoryview(data)
+        self._pos  = 0
+
+    def read(self, size: int = -1) -> bytes:
+        end = len(self._data) if size < 0 else self._pos + size
+        data = self._data[self._pos:end].tobytes()
+        self._pos += len(data)
+        return data
+
+def eml_tar(messages: Iterable[RawMessage]) -> Iterator[bytes]:
+    """ Write messages as the '<uid>.eml' files of a tar archive.
+
+    Parameters:
+    -----------
+    messages: Iterable[RawMessage]
+        Messages to be archived.
+
+    Return:
+    -------
+    chunks: Iterator[bytes]
+        The tar file, one message at a time.
+    """
+    buffer = _Buffer()
+    with tarfile.open(fileobj=buffer, mode='w|') as tar:
+        for uid, date, raw in messages:
+            info = tarfile.TarInfo(name=f'{uid}.eml')
+            info.size  = len(raw)
+            info.mtime = int(time.mktime(date)) if date is not None else 0
+            tar.addfile(info, _Reader(raw))
+            yield buffer.take()
+    yield buffer.take()
+
+def _mbox_message(lines: List[bytes], date: Optional[float]) -> AppendMessage:
+    raw = b''.join(lines)
+    if raw.endswith(b'\n\n'):
+        raw = raw[:-1]
+    headers = BytesHeaderParser().parsebytes(raw.split(b'\n\n', 1)[0])
+    status = (headers['Status'] or '') + (headers['X-Status'] or '')
+    flags = sorted({_STATUS_FLAGS[letter] for letter in status if letter in _STATUS_FLAGS})
+    return raw, flags, date
+
+def read_mbox(file: BinaryIO) -> Iterator[AppendMessage]:
+    """ Read the messages of a mbox file (mboxrd), line by line. Internal dates come
+    from the 'From ' separator lines, flags from the Status and X-Status headers.
+
+    Parameters:
+    -----------
+    file: BinaryIO
+        mbox file.
+
+    Return:
+    -------
+    messages: Iterator[AppendMessage]
+        Raw message, flags and internal date of each message.
+    """
+    lines: Optional[List[bytes]] = None
+    date: Optional[float] = None
+    for line in file:
+        if line.startswith(b'From '):
+            if lines is not None:
+                yield _mbox_message(lines, date)
+            lines = []
+            try:
+                date = time.mktime(time.strptime(line.split(None, 2)[2].decode('ascii').strip(),
+                                                 '%a %b %d %H:%M:%S %Y'))
+            except (IndexError, UnicodeDecodeError, ValueError):
+                date = None
+        elif lines is not None:
+            lines.append(_QUOTED_FROM.sub(rb'\1', line))
+    if lines is not None:
+        yield _mbox_message(lines, date)
+
+def read_ndjson(file: BinaryIO) -> Iterator[AppendMessage]:
+    """ Read messages from NDJSON lines {"message": ..., "flags": [...], "internal_date": ...},
+    where "message" is the base64 encoded raw message and "internal_date" a RFC 2822
+    or ISO 8601 date. Dates without timezone are taken as UTC.
+
+    Parameters:
+    -----------
+    file: BinaryIO
+        NDJSON file.
+
+    Return:
+    -------
+    messages: Iterator[AppendMessage]
+        Raw message, flags and internal date of each message.
+    """
+    for line in file:
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        date = item.get('internal_date')
+        if date:
+            try:
+                date = datetime.fromisoformat(date)
+            except ValueError:
+                date = parsedate_to_datetime(date)
+            if date.tzinfo is None:
+                date = date.replace(tzinfo=timezone.utc)
+        yield base64.b64decode(item['message']), item.get('flags') or [], date or None
@@ -2,10 +2,36 @@ from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
 from email.mime.text import MIMEText
 from email import encoders, message_from_bytes
-from typing import Optional, Dict, List
-import smtplib
+from email.parser import BytesHeaderParser
+from email.utils import getaddresses
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import contextvars
+from typing import Optional, Dict, Iterable, Iterator, List, Tuple
+import hashlib
 import imaplib
+import queue
 import re
+import threading
+from dependencies.config import config
+from dependencies.coalescing.coalescing import coalesced, invalidates
+from dependencies.circuits.circuits import circuits
+from dependencies.deadlines import deadlines
+from dependencies.emails.imap import IMAP4_SSL, AppendMessage
+from dependencies.emails.smtp import SMTP
+from dependencies.emails.jwz import parse_thread_response, thread_messages
+
+# Messages whose RFC822.SIZE, or threading headers, are asked by each FETCH.
+_FETCH_BATCH = 1000
+_RFC822_SIZE = re.compile(rb'^(\d+) \(.*RFC822\.SIZE (\d+)')
+
+def _quoted(mailbox: str) -> str:
+    """ Mailbox path as an IMAP quoted string, so that paths with spaces can be
+    selected. Paths already quoted by the client are kept as they are.
+    """
+    if len(mailbox) > 1 and mailbox[0] == mailbox[-1] == '"':
+        return mailbox
+    return '"' + mailbox.replace('\\', '\\\\').replace('"', '\\"') + '"'
 
 class email:
     """
@@ -13,7 +39,8 @@ class email:
     """
 
     def __init__(self, login: str, password: str, 
-                smtp_server: Dict[str,str], imap_server: Dict[str,str]) -> None:
+                smtp_server: Dict[str,str], imap_server: Dict[str,str],
+                keep_alive: int = 0) -> None:
         """
         Parameters:
         -----------
@@ -25,6 +52,8 @@ class email:
             "Address and port of the SMTP server from email provider."
         imap_server: str
             "Address and port of the IMAP server from email provider."
+        keep_alive: int
+            "Number of idle IMAP connections kept open for reuse. 0 logs out after each operation."
 
         Return:
         -------
@@ -34,6 +63,166 @@ class email:
         self.password    = password
         self.smtp_server = smtp_server
         self.imap_server = imap_server
+        self.keep_alive  = keep_alive
+        # Identity of the account for request coalescing. The password is part of
+        # it so that wrong credentials never get the result of valid ones.
+        self.account     = (imap_server['host'], str(imap_server['port']), login,
+                            hashlib.sha256(password.encode('utf-8')).hexdigest())
+        self._idle: List[IMAP4_SSL] = []
+        self._lock       = threading.Lock()
+
+    def _imap(self) -> IMAP4_SSL:
+        """ Open an authenticated IMAP connection, compressed with DEFLATE
+        when the server supports it and compression is enabled.
+
+        Return:
+        -------
+        imap: IMAP4_SSL
+            Logged in IMAP connection.
+        """
+        imap = IMAP4_SSL(
+            host=self.imap_server['host'],
+            port=int(self.imap_server['port']),
+            timeout=config.IMAP_TIMEOUT,
+            circuit=circuits.get(self.imap_server['host'], self.imap_server['port'])
+            )
+        imap.login(
+            user    =self.login,
+            password=self.password
+            )
+        if config.IMAP_COMPRESS:
+            imap.compress(config.IMAP_COMPRESS_LEVEL)
+        return imap
+
+    def _acquire(self) -> IMAP4_SSL:
+        """ Take an idle IMAP connection that still answers NOOP, or open a new one.
+        Fails fast with CircuitOpen while the server is not answering. The connection
+        is interrupted if the current request is cancelled, until it is released.
+        """
+        circuits.get(self.imap_server['host'], self.imap_server['port']).check()
+        imap = None
+        while imap is None:
+            with self._lock:
+                if not self._idle:
+                    break
+                imap = self._idle.pop()
+            try:
+                imap.noop()
+            except Exception:
+                self._logout(imap)
+                imap = None
+        if imap is None:
+            imap = self._imap()
+        imap.unwatch = deadlines.watch(imap.interrupt)
+        return imap
+
+    def _release(self, imap: IMAP4_SSL, reusable: bool = True) -> None:
+        """ Give back a connection taken with `_acquire`. It is kept for reuse while
+        there are fewer than `keep_alive` idle connections, logged out otherwise.
+        """
+        imap.unwatch()
+        if reusable:
+            imap.circuit.success()
+            with self._lock:
+                if len(self._idle) < self.keep_alive:
+                    self._idle.append(imap)
+                    return
+        self._logout(imap)
+
+    @staticmethod
+    def _logout(imap: IMAP4_SSL) -> None:
+        try:
+            imap.logout()
+        except Exception:
+            pass
+
+    @contextmanager
+    def _connection(self) -> Iterator[IMAP4_SSL]:
+        """ IMAP connection for the duration of a `with` block. Connections left in an
+        unknown state by an error are not reused.
+        """
+        imap = self._acquire()
+        try:
+            yield imap
+        except BaseException:
+            self._release(imap, reusable=False)
+            raise
+        self._release(imap)
+
+    def close(self) -> None:
+        """ Log out the idle IMAP connections, and stop keeping connections for reuse.
+        """
+        with self._lock:
+            self.keep_alive = 0
+            idle, self._idle = self._idle, []
+        for imap in idle:
+            self._logout(imap)
+
+    def capabilities(self) -> List[str]:
+        """ Log in to the IMAP server and get its capabilities.
+
+        Return:
+        -------
+        capabilities: List[str]
+            IMAP capabilities advertised by the server after login.
+        """
+        with self._connection() as imap:
+            return imap.server_capabilities()
+
+    @contextmanager
+    def _smtp(self) -> Iterator[SMTP]:
+        """ Authenticated SMTP connection for the duration of a `with` block. Fails fast
+        with CircuitOpen while the server is not answering, and is interrupted if the
+        current request is cancelled.
+
+        Return:
+        -------
+        smtp: SMTP
+            Logged in SMTP connection.
+        """
+        circuit = circuits.get(self.smtp_server['host'], self.smtp_server['port'])
+        circuit.check()
+        smtp = SMTP(
+            host=self.smtp_server['host'], 
+            port=int(self.smtp_server['port']),
+            timeout=config.SMTP_TIMEOUT,
+            circuit=circuit
+            )
+        unwatch = deadlines.watch(smtp.interrupt)
+        try:
+            smtp.starttls()
+            smtp.login(self.login,self.password)
+            yield smtp
+            circuit.success()
+        finally:
+            unwatch()
+            try:
+                smtp.quit()
+            except Exception:
+                smtp.close()
+
+    @staticmethod
+    def _envelope_recipients(*fields: Optional[str]) -> List[str]:
+        """ Addresses of To/Cc header values, for the SMTP envelope.
+        """
+        return [address for _, address in getaddresses([field for field in fields if field])
+                        if address]
+
+    @staticmethod
+    def _attachment_part(attachment: Dict[str,str]) -> MIMEBase:
+        """ MIME part of an attachment. A 'payload' already encoded in base64,
+        e.g. from the attachment store, is used as is.
+        """
+        att = MIMEBase('application','octet-stream')
+        if attachment.get('payload') is not None:
+            att.set_payload(attachment['payload'])
+            att['Content-Transfer-Encoding'] = 'base64'
+        else:
+            file = bytes(attachment['file'], encoding=attachment['encoding'])
+            att.set_payload(file)
+            encoders.encode_base64(att)
+        att.add_header('Content-Disposition',f'attachment; filename= {attachment["filename"]}')
+        return att
 
     def send_email( self,
                     sender: str, recipients: str|List[str], Cc: Optional[str|List[str]], 
@@ -71,7 +260,8 @@ class email:
 
         Return:
         --------
-        _SendErrs
+        statuses: dict[str, tuple[int, bytes]]
+            SMTP reply code and message of each recipient.
         """
         msg = MIMEMultipart()
         msg['Subject'] = subject
@@ -84,29 +274,16 @@ class email:
 
         if attachments is not None:
             for attachment in attachments:
-                att = MIMEBase('application','octet-stream')
-                file = bytes(attachment['file'], encoding=attachment['encoding'])
-                att.set_payload(file)
-                encoders.encode_base64(att)
-                att.add_header('Content-Disposition',f'attachment; filename= {attachment["filename"]}')
-                msg.attach(att)
-        smtp = smtplib.SMTP(
-            host=self.smtp_server['host'], 
-            port=int(self.smtp_server['port'])
-            )
-        smtp.starttls()
-        smtp.login(self.login,self.password)
+                msg.attach(self._attachment_part(attachment))
 
-        recipients = recipients if type(recipients)==list else recipients.replace(' ','').split(',')
-        if Cc is None:
+        recipients = list(recipients) if type(recipients)==list else recipients.replace(' ','').split(',')
+        if Cc is not None:
             recipients.extend(Cc) if type(Cc)==list else recipients.extend(Cc.replace(' ','').split(','))
         
-        return smtp.sendmail(
-            msg['From'],
-            recipients,
-            msg.as_string()
-            )
+        with self._smtp() as smtp:
+            return smtp.send_chunked(msg, msg['From'], recipients, config.SMTP_CHUNK_SIZE)
     
+    @coalesced
     def get_mailboxes(self) -> List[str]:
         """ Get mailboxes.
 
@@ -120,19 +297,12 @@ class email:
             List containing mailboxes names.
         """
 
-        imap = imaplib.IMAP4_SSL(
-        host=self.imap_server['host'],
-        port=int(self.imap_server['port'])
-        )
-        
-        imap.login(
-            user    =self.login,
-            password=self.password
-            )
-        mailboxes = [item.decode('utf-8').split(r' "/" ')[1].replace(r'"','') 
-                                                for item in imap.list()[1]]
-        return mailboxes
+        with self._connection() as imap:
+            mailboxes = [item.decode('utf-8').split(r' "/" ')[1].replace(r'"','') 
+                                                    for item in imap.list()[1]]
+            return mailboxes
     
+    @coalesced
     def get_emails_uids(self, mailbox: str, criterias_dict: Dict[str,str]) -> List[str]:
         """ Get email UIDs, given mailbox and criterias dict
 
@@ -149,20 +319,278 @@ class email:
         email_ids: List[str]
             List containing emails UIDs corresponding to given criterias.
         """
-        imap = imaplib.IMAP4_SSL(
-            host= self.imap_server['host'],
-            port=int(self.imap_server['port'])
-            )
-            
-        imap.login(
-            user    =self.login,
-            password=self.password
-            )
-        imap.select(mailbox, readonly=True)
+        with self._connection() as imap:
+            imap.select(_quoted(mailbox), readonly=True)
+            criterias = ' '.join([' '.join([key,criterias_dict[key]]) for key in criterias_dict.keys()])
+            email_ids = imap.search(None,criterias)[1][0].decode('utf-8').split()
+            return email_ids
+
+    def search_mailboxes(self, mailboxes: str|List[str], criterias_dict: Dict[str,str],
+                         connections: int = 4) -> Iterator[Tuple[str, Optional[List[str]], Optional[str]]]:
+        """ Search several mailboxes in parallel, over at most `connections` IMAP connections.
+
+        Parameters:
+        -----------
+        mailboxes: str|List[str]
+            List of mailboxes paths, or 'all' to search every selectable mailbox.
+        criterias_dict: Dict[str,str]
+            Dict with search criterias as specified in RFC 3501 (https://www.rfc-editor.org/rfc/rfc3501#section-6.4.4).
+            You must put the criteria keys as the dictionary keys, end the key parameter as the values.
+        connections: int
+            Maximum number of simultaneous IMAP connections.
+
+        Return:
+        -------
+        results: Iterator[Tuple[str, Optional[List[str]], Optional[str]]]
+            Mailbox path, emails UIDs and error, yielded as each mailbox search completes.
+            A mailbox that cannot be selected has no UIDs but the server's error, and
+            does not stop the search of the others.
+            The first connection is opened, and mailboxes listed, before returning, so
+            that login and connection errors are raised here.
+        """
         criterias = ' '.join([' '.join([key,criterias_dict[key]]) for key in criterias_dict.keys()])
-        email_ids = imap.search(None,criterias)[1][0].decode('utf-8').split()
-        return email_ids
+        first = self._acquire()
+        if mailboxes == 'all':
+            try:
+                mailboxes = [item.decode('utf-8').split(r' "/" ')[1].replace(r'"','')
+                                for item in first.list()[1] if b'\\Noselect' not in item]
+            except Exception:
+                self._release(first, reusable=False)
+                raise
+        elif isinstance(mailboxes, str):
+            mailboxes = [mailboxes]
+
+        pending: queue.Queue = queue.Queue()
+        for mailbox in mailboxes:
+            pending.put(mailbox)
+        results: queue.Queue = queue.Queue()
+        stop = threading.Event()
+
+        def search(imap) -> None:
+            try:
+                imap = imap if imap is not None else self._acquire()
+            except Exception as error:
+                results.put((None, None, None, error))
+                return
+            try:
+                while not stop.is_set():
+                    try:
+                        mailbox = pending.get_nowait()
+                    except queue.Empty:
+                        break
+                    typ, dat = imap.select(_quoted(mailbox), readonly=True)
+                    if typ != 'OK':
+                        results.put((mailbox, None, f'SELECT {typ}: {dat[0].decode("utf-8", "replace")}', None))
+                        continue
+                    email_ids = imap.search(None,criterias)[1][0].decode('utf-8').split()
+                    results.put((mailbox, email_ids, None, None))
+            except Exception as error:
+                self._release(imap, reusable=False)
+                results.put((None, None, None, error))
+            else:
+                self._release(imap)
+
+        def searched() -> Iterator[Tuple[str, Optional[List[str]], Optional[str]]]:
+            workers = max(1, min(connections, len(mailboxes)))
+            executor = ThreadPoolExecutor(max_workers=workers)
+            # Workers run under the deadline of the request.
+            executor.submit(contextvars.copy_context().run, search, first)
+            for _ in range(workers - 1):
+                executor.submit(contextvars.copy_context().run, search, None)
+            try:
+                for _ in mailboxes:
+                    mailbox, email_ids, failure, error = results.get()
+                    if error is not None:
+                        raise error
+                    yield mailbox, email_ids, failure
+            finally:
+                stop.set()
+                executor.shutdown(wait=False)
+
+        return searched()
     
+    def get_threads(self, mailbox: str, criterias_dict: Dict[str,str]) -> List[List[dict]]:
+        """ Get conversation threads, given mailbox and criterias dict. Uses the server
+        THREAD=REFERENCES extension (RFC 5256) when available, and threads the
+        messages headers locally otherwise.
+
+        Parameters:
+        -----------
+        mailbox: str
+            Mailbox string
+        criterias_dict: Dict[str,str]
+            Dict with search criterias as specified in RFC 3501 (https://www.rfc-editor.org/rfc/rfc3501#section-6.4.4).
+            You must put the criteria keys as the dictionary keys, end the key parameter as the values.
+
+        Return:
+        -------
+        threads: List[List[dict]]
+            Threads, as lists of the emails UIDs in depth-first order of the thread tree,
+            with their depth in it: dicts {'uid': str|None, 'depth': int}. A None uid
+            stands for a message referenced by the thread but not in the mailbox.
+        """
+        criterias = ' '.join([' '.join([key,criterias_dict[key]]) for key in criterias_dict.keys()])
+        with self._connection() as imap:
+            imap.select(_quoted(mailbox), readonly=True)
+            if 'THREAD=REFERENCES' in imap.server_capabilities():
+                typ, dat = imap.thread('REFERENCES', 'UTF-8', criterias)
+                if typ == 'OK':
+                    return parse_thread_response(b''.join(item for item in dat if item))
+
+            email_ids = imap.search(None,criterias)[1][0].decode('utf-8').split()
+            if not email_ids:
+                return []
+            dat = []
+            for start in range(0, len(email_ids), _FETCH_BATCH):
+                dat += imap.fetch(','.join(email_ids[start:start + _FETCH_BATCH]),
+                        '(BODY.PEEK[HEADER.FIELDS (MESSAGE-ID IN-REPLY-TO REFERENCES DATE)])')[1]
+        parser = BytesHeaderParser()
+        messages = [(item[0].split()[0].decode('ascii'), parser.parsebytes(item[1]))
+                        for item in dat if isinstance(item, tuple)]
+        return thread_messages(messages)
+
+    def export_messages(self, mailbox: str, criterias_dict: Dict[str,str],
+                        batch_size: int = 50) -> Iterator[Tuple[str, Optional[tuple], bytes]]:
+        """ Get the raw messages of a mailbox, fetched in batches so memory stays bounded.
+        The search runs before returning, so that login and mailbox errors are raised
+        here; the messages are fetched as the returned iterator is consumed.
+
+        Parameters:
+        -----------
+        mailbox: str
+            Mailbox string
+        criterias_dict: Dict[str,str]
+            Dict with search criterias as specified in RFC 3501 (https://www.rfc-editor.org/rfc/rfc3501#section-6.4.4).
+            You must put the criteria keys as the dictionary keys, end the key parameter as the values.
+        batch_size: int
+            Maximum messages fetched by each FETCH command. Batches are also cut so
+            that their messages total at most `EXPORT_BATCH_BYTES`.
+
+        Return:
+        -------
+        messages: Iterator[Tuple[str, Optional[tuple], bytes]]
+            UID, internal date (time tuple) and raw RFC822 bytes of each message.
+        """
+        criterias = ' '.join([' '.join([key,criterias_dict[key]]) for key in criterias_dict.keys()])
+        imap = self._acquire()
+        try:
+            typ, dat = imap.select(_quoted(mailbox), readonly=True)
+            if typ != 'OK':
+                raise imap.error(f'SELECT {mailbox}: {dat}')
+            email_ids = imap.search(None,criterias)[1][0].decode('utf-8').split()
+        except BaseException:
+            self._release(imap, reusable=False)
+            raise
+
+        def batches() -> Iterator[str]:
+            """ Message sets of at most `batch_size` messages and `EXPORT_BATCH_BYTES`
+            bytes, from the RFC822.SIZE of the messages. Larger messages go alone.
+            """
+            for start in range(0, len(email_ids), _FETCH_BATCH):
+                sizes = {}
+                for item in imap.fetch(','.join(email_ids[start:start + _FETCH_BATCH]), '(RFC822.SIZE)')[1]:
+                    match = _RFC822_SIZE.match(item if isinstance(item, bytes) else item[0])
+                    if match:
+                        sizes[match.group(1).decode('ascii')] = int(match.group(2))
+                batch, total = [], 0
+                for email_id in email_ids[start:start + _FETCH_BATCH]:
+                    size = sizes.get(email_id, 0)
+                    if batch and (len(batch) >= batch_size or total + size > config.EXPORT_BATCH_BYTES):
+                        yield ','.join(batch)
+                        batch, total = [], 0
+                    batch.append(email_id)
+                    total += size
+                if batch:
+                    yield ','.join(batch)
+
+        def messages() -> Iterator[Tuple[str, Optional[tuple], bytes]]:
+            reusable = False
+            try:
+                for batch in batches():
+                    for item in imap.fetch(batch, '(INTERNALDATE BODY.PEEK[])')[1]:
+                        if isinstance(item, tuple):
+                            yield (item[0].split()[0].decode('ascii'),
+                                   imaplib.Internaldate2tuple(item[0]), item[1])
+                reusable = True
+            finally:
+                self._release(imap, reusable=reusable)
+
+        return messages()
+
+    @invalidates
+    def import_messages(self, mailbox: str, messages: Iterable[AppendMessage],
+                        batch_size: int = 50) -> dict:
+        """ Append messages to a mailbox over one connection, several per APPEND command
+        when the server supports MULTIAPPEND (RFC 3502), as non-synchronizing literals
+        when it supports LITERAL+. Stops at the first invalid message, or batch refused
+        by the server.
+        Batches hold at most `IMPORT_BATCH_BYTES` bytes of messages. Larger messages go alone.
+
+        Parameters:
+        -----------
+        mailbox: str
+            Destination mailbox.
+        messages: Iterable[AppendMessage]
+            Raw message, flags and internal date of each message.
+        batch_size: int
+            Messages per APPEND command, when MULTIAPPEND is supported.
+
+        Return:
+        -------
+        response: dict
+            Number of imported messages, their UIDs when the server reports them
+            (UIDPLUS), and the input or server error that stopped the import, if any.
+        """
+        response = {'imported': 0, 'uids': [], 'error': None}
+        with self._connection() as imap:
+            capabilities = imap.server_capabilities()
+            if 'MULTIAPPEND' not in capabilities:
+                batch_size = 1
+            literal_plus = 'LITERAL+' in capabilities
+
+            batch: List[AppendMessage] = []
+            def append() -> bool:
+                try:
+                    typ, dat, uids = imap.multiappend(_quoted(mailbox), batch, literal_plus)
+                except (TypeError, ValueError) as error:
+                    response['error'] = f'Invalid flags or internal date: {error}'
+                    return False
+                except imaplib.IMAP4.error as error:
+                    response['error'] = f'APPEND: {error}'
+                    return False
+                if typ != 'OK':
+                    response['error'] = f'APPEND {typ}: {dat[-1]!r}'
+                    return False
+                response['imported'] += len(batch)
+                response['uids'].extend(uids)
+                batch.clear()
+                return True
+
+            messages = iter(messages)
+            total = 0
+            while True:
+                try:
+                    message = next(messages, None)
+                except (KeyError, TypeError, ValueError) as error:
+                    # Import the valid messages read so far, then report the invalid one.
+                    position = response['imported'] + len(batch) + 1
+                    if not batch or append():
+                        response['error'] = f'Invalid message {position}: {error!r}'
+                    return response
+                if message is None:
+                    break
+                size = len(message[0])
+                if batch and (len(batch) >= batch_size or total + size > config.IMPORT_BATCH_BYTES):
+                    if not append():
+                        return response
+                    total = 0
+                batch.append(message)
+                total += size
+            if batch:
+                append()
+        return response
+
+    @coalesced
     def get_email(self, uid: str, mailbox: str) -> dict:
         """ Get emails, given mailbox and emails UIDs.
 
@@ -177,59 +605,53 @@ class email:
             emails_json: dict
                 Json containing email message contents.
         """
-        imap = imaplib.IMAP4_SSL(
-            host= self.imap_server['host'],
-            port=int(self.imap_server['port'])
-            )
-        imap.login(
-            user    =self.login,
-            password=self.password
-            )
-        imap.select(mailbox, readonly=True)
+        with self._connection() as imap:
+            imap.select(_quoted(mailbox), readonly=True)
     
-        data = imap.fetch(uid, 'RFC822')[1][0][1]
-        email_message = message_from_bytes(data)        
-        email_json: dict = {}
-        email_json['Subject'] = email_message['Subject']
-        email_json['Date']    = email_message['Date']
-        try:
-            from_name = re.search('"(.*)"', email_message['From']).group(1)
-        except AttributeError:
-            from_name = ''
-        try:
-            from_email= re.search('<(.*)>', email_message['From']).group(1)
-        except AttributeError:
-            from_email= email_message['From']
-        email_json['From']    = {'name': from_name, 'email': from_email}
-
-        attachments = []
-        body: List[Dict[str,str]] = []
-        if email_message.is_multipart():
-            for part in email_message.walk():
-                ctype = part.get_content_type()
-                if ctype in ['text/html','text/plain']:
-                    body.append({
-                        'content_type': ctype,
-                        'content': part.get_payload()
-                            }
-                        )
-                if part.get_content_maintype() != 'multipart' and part.get('Content-Disposition') is not None:
-                    attachments.append({
-                        'filename': '' if part.get_filename() is None else part.get_filename(),
-                        'encoding': 'base64',
-                        'file': part.get_payload()
-                            }
-                        )
-        else:
-            body.append({
-                'content_type': email_message.get_content_type(),
-                'content': email_message.get_payload()
-                    }
-                )   
-        email_json['Body']        = body
-        email_json['attachments'] = attachments
-        return email_json
+            data = imap.fetch(uid, 'RFC822')[1][0][1]
+            email_message = message_from_bytes(data)        
+            email_json: dict = {}
+            email_json['Subject'] = email_message['Subject']
+            email_json['Date']    = email_message['Date']
+            try:
+                from_name = re.search('"(.*)"', email_message['From']).group(1)
+            except AttributeError:
+                from_name = ''
+            try:
+                from_email= re.search('<(.*)>', email_message['From']).group(1)
+            except AttributeError:
+                from_email= email_message['From']
+            email_json['From']    = {'name': from_name, 'email': from_email}
+
+            attachments = []
+            body: List[Dict[str,str]] = []
+            if email_message.is_multipart():
+                for part in email_message.walk():
+                    ctype = part.get_content_type()
+                    if ctype in ['text/html','text/plain']:
+                        body.append({
+                            'content_type': ctype,
+                            'content': part.get_payload()
+                                }
+                            )
+                    if part.get_content_maintype() != 'multipart' and part.get('Content-Disposition') is not None:
+                        attachments.append({
+                            'filename': '' if part.get_filename() is None else part.get_filename(),
+                            'encoding': 'base64',
+                            'file': part.get_payload()
+                                }
+                            )
+            else:
+                body.append({
+                    'content_type': email_message.get_content_type(),
+                    'content': email_message.get_payload()
+                        }
+                    )   
+            email_json['Body']        = body
+            email_json['attachments'] = attachments
+            return email_json
     
+    @invalidates
     def move_email(self, from_box: str, uid: str, to_box: str) -> Dict:
         """ Move email message from one mailbox to another.
 
@@ -247,26 +669,20 @@ class email:
         response: dict
             Dictionary containing the move and delete operations reponses.
         """
-        imap = imaplib.IMAP4_SSL(
-            host= self.imap_server['host'],
-            port=int(self.imap_server['port'])
-            )
-        imap.login(
-            user    =self.login,
-            password=self.password
-            )
-        imap.select(from_box)
+        with self._connection() as imap:
+            imap.select(_quoted(from_box))
 
-        copy_response = imap.copy(uid, to_box)
-        delete_response = imap.store(uid, '+FLAGS', '\\Deleted')
-        imap.expunge()
+            copy_response = imap.copy(uid, _quoted(to_box))
+            delete_response = imap.store(uid, '+FLAGS', '\\Deleted')
+            imap.expunge()
 
-        response = {
-            'copy_response'  : copy_response[0],
-            'delete_response': delete_response[0]
-        }
-        return response
+            response = {
+                'copy_response'  : copy_response[0],
+                'delete_response': delete_response[0]
+            }
+            return response
     
+    @invalidates
     def delete_email(self, mailbox: str, uid: str) -> dict[str, tuple[int, bytes]]:
         """ Move email message from one mailbox to another.
 
@@ -282,23 +698,16 @@ class email:
         response: dict
             Dictionary containing the delete operation reponse.
         """
-        imap = imaplib.IMAP4_SSL(
-            host= self.imap_server['host'],
-            port=int(self.imap_server['port'])
-            )
-        imap.login(
-            user    =self.login,
-            password=self.password
-            )
-        imap.select(mailbox)
+        with self._connection() as imap:
+            imap.select(_quoted(mailbox))
 
-        delete_response = imap.store(uid, '+FLAGS', '\\Deleted')
-        imap.expunge()
+            delete_response = imap.store(uid, '+FLAGS', '\\Deleted')
+            imap.expunge()
 
-        response = {
-            'delete_response': delete_response[0]
-        }
-        return response
+            response = {
+                'delete_response': delete_response[0]
+            }
+            return response
     
     def reply_email(self, mailbox: str, uid: str, sender: str, body: str, 
             body_type: str, attachments: List[Dict[str,str]]) -> dict[str, tuple[int, bytes]]:
@@ -316,56 +725,44 @@ class email:
         body_type: str
             Type of the body content structure. For exemple, you can choose 'plain' for plain text content.  
             If the content has html format, then you choose 'html'.
-        
+
+        Return:
+        --------
+        statuses: dict[str, tuple[int, bytes]]
+            SMTP reply code and message of each recipient.
         """
-        smtp = smtplib.SMTP(
-                    host=self.smtp_server['host'], 
-                    port=int(self.smtp_server['port'])
-                    )
-        smtp.starttls()
-        smtp.login(self.login,self.password)
-        imap = imaplib.IMAP4_SSL(
-            host= self.imap_server['host'],
-            port=int( self.imap_server['port'])
-            )
-        imap.login(
-            user    =self.login,
-            password=self.password
-            )
-        imap.select(mailbox)
-
-        data = imap.fetch(uid, 'RFC822')[1][0][1]
-        email_message = message_from_bytes(data)        
-        msg = MIMEMultipart('mixed')
-        _body = MIMEMultipart('alternative')
-
-        headers: dict = {}
-        headers['From']   = sender
-        headers['To']     = email_message['To']
-        headers['Cc']     = email_message['Cc']
-        for key in headers:
-            value = headers[key]
-            if isinstance(value,list):
-                value = ', '.join(value)
-            msg.add_header(key,value)
-
-        if email_message is not None:
-            msg['Subject'] = "RE: "+email_message['Subject'].replace("Re: ", "").replace("RE: ", "")
-            msg['In-Reply-To'] = email_message['Message-ID']
-            msg['References'] = email_message['Message-ID']
-            msg['Thread-Topic'] = email_message['Thread-Topic']
-            msg['Thread-Index'] = email_message['Thread-Index']
-        if attachments is not None:
-                    for attachment in attachments:
-                        att = MIMEBase('application','octet-stream')
-                        file = bytes(attachment['file'], encoding=attachment['encoding'])
-                        att.set_payload(file)
-                        encoders.encode_base64(att)
-                        att.add_header('Content-Disposition',f'attachment; filename= {attachment["filename"]}')
-                        msg.attach(att)
-        _body.attach(MIMEText(body, body_type))
-        msg.attach(_body)
-        return smtp.sendmail(msg['From'],[msg['To']],msg.as_string())
+        with self._connection() as imap:
+            imap.select(_quoted(mailbox))
+
+            data = imap.fetch(uid, 'RFC822')[1][0][1]
+            email_message = message_from_bytes(data)        
+            msg = MIMEMultipart('mixed')
+            _body = MIMEMultipart('alternative')
+
+            headers: dict = {}
+            headers['From']   = sender
+            headers['To']     = email_message['To']
+            headers['Cc']     = email_message['Cc']
+            for key in headers:
+                value = headers[key]
+                if isinstance(value,list):
+                    value = ', '.join(value)
+                msg.add_header(key,value)
+
+            if email_message is not None:
+                msg['Subject'] = "RE: "+email_message['Subject'].replace("Re: ", "").replace("RE: ", "")
+                msg['In-Reply-To'] = email_message['Message-ID']
+                msg['References'] = email_message['Message-ID']
+                msg['Thread-Topic'] = email_message['Thread-Topic']
+                msg['Thread-Index'] = email_message['Thread-Index']
+            if attachments is not None:
+                for attachment in attachments:
+                    msg.attach(self._attachment_part(attachment))
+            _body.attach(MIMEText(body, body_type))
+            msg.attach(_body)
+        with self._smtp() as smtp:
+            return smtp.send_chunked(msg, msg['From'], self._envelope_recipients(msg['To']),
+                                     config.SMTP_CHUNK_SIZE)
     
     def forward(self, mailbox: str, uid: str, recipients: str, 
                 sender: str) -> dict[str, tuple[int, bytes]]:
@@ -381,32 +778,27 @@ class email:
             String containing recipiends email addresses, separated bi comma.
         sender: str
             Sender name that will appear on the message, satisfying provider policy.
+
+        Return:
+        --------
+        statuses: dict[str, tuple[int, bytes]]
+            SMTP reply code and message of each recipient.
         """
-        smtp = smtplib.SMTP(
-                    host=self.smtp_server['host'], 
-                    port=int(self.smtp_server['port'])
-                    )
-        smtp.starttls()
-        smtp.login(self.login,self.password)
-        imap = imaplib.IMAP4_SSL(
-            host= self.imap_server['host'],
-            port=int(self.imap_server['port'])
-            )
-        imap.login(
-            user    =self.login,
-            password=self.password
-            )
-        imap.select(mailbox)
+        with self._connection() as imap:
+            imap.select(_quoted(mailbox))
 
-        data = imap.fetch(uid, 'RFC822')[1][0][1]
-        msg = message_from_bytes(data)        
+            data = imap.fetch(uid, 'RFC822')[1][0][1]
+            msg = message_from_bytes(data)        
 
-        msg.replace_header('From',sender)
-        msg.replace_header('To',recipients)
-        msg.replace_header('Subject','Forwarded: '+msg['Subject']\
-                           .replace('FWD: ','').replace('Fwd: ',''))
-        return smtp.sendmail(msg['From'],[msg['To']],msg.as_string())
+            msg.replace_header('From',sender)
+            msg.replace_header('To',recipients)
+            msg.replace_header('Subject','Forwarded: '+msg['Subject']\
+                               .replace('FWD: ','').replace('Fwd: ',''))
+        with self._smtp() as smtp:
+            return smtp.send_chunked(msg, msg['From'], self._envelope_recipients(msg['To']),
+                                     config.SMTP_CHUNK_SIZE)
     
+    @invalidates
     def mailbox_create(self, new_mailbox: str) -> list:
         """ Create mailbox.
 
@@ -420,22 +812,10 @@ class email:
         _CommandResults:
             Imaplib create response.
         """
-        smtp = smtplib.SMTP(
-                    host=self.smtp_server['host'], 
-                    port=int(self.smtp_server['port'])
-                    )
-        smtp.starttls()
-        smtp.login(self.login,self.password)
-        imap = imaplib.IMAP4_SSL(
-            host= self.imap_server['host'],
-            port=int( self.imap_server['port'])
-            )
-        imap.login(
-            user    =self.login,
-            password=self.password
-            )
-        return imap.create(new_mailbox)[1]
+        with self._connection() as imap:
+            return imap.create(_quoted(new_mailbox))[1]
     
+    @invalidates
     def mailbox_delete(self, mailbox: str) -> list:
         """ Delete mailbox.
 
@@ -449,22 +829,10 @@ class email:
         _CommandResults:
             Imaplib delete response.
         """
-        smtp = smtplib.SMTP(
-                    host=self.smtp_server['host'], 
-                    port=int(self.smtp_server['port'])
-                    )
-        smtp.starttls()
-        smtp.login(self.login,self.password)
-        imap = imaplib.IMAP4_SSL(
-            host= self.imap_server['host'],
-            port=int( self.imap_server['port'])
-            )
-        imap.login(
-            user    =self.login,
-            password=self.password
-            )
-        return imap.delete(mailbox)[1]
+        with self._connection() as imap:
+            return imap.delete(_quoted(mailbox))[1]
     
+    @invalidates
     def mailbox_rename(self, old_mailbox: str, new_mailbox: str) -> list:
         """ Create mailbox.
 
@@ -480,18 +848,5 @@ class email:
         _CommandResults:
             Imaplib rename response.
         """
-        smtp = smtplib.SMTP(
-                    host=self.smtp_server['host'], 
-                    port=int(self.smtp_server['port'])
-                    )
-        smtp.starttls()
-        smtp.login(self.login,self.password)
-        imap = imaplib.IMAP4_SSL(
-            host= self.imap_server['host'],
-            port=int( self.imap_server['port'])
-            )
-        imap.login(
-            user    =self.login,
-            password=self.password
-            )
-        return imap.rename(old_mailbox, new_mailbox)[1]
\ No newline at end of file
+        with self._connection() as imap:
+            return imap.rename(_quoted(old_mailbox), _quoted(new_mailbox))[1]
\ No newline at end of file
@@ -0,0 +1,228 @@
+import imaplib
+import re
+import socket
+import zlib
+from typing import Any, Callable, List, Optional, Tuple
+from dependencies.deadlines import deadlines
+
+# Message to append: raw RFC822 bytes, flags and internal date (any value
+# accepted by imaplib.Time2Internaldate, or None for the server time).
+AppendMessage = Tuple[bytes, List[str], Optional[object]]
+
+_UID_RANGE = re.compile(r'^(\d+):(\d+)$')
+
+class IMAP4_SSL(imaplib.IMAP4_SSL):
+    """
+    imaplib.IMAP4_SSL with support for the COMPRESS=DEFLATE (RFC 4978) and
+    MULTIAPPEND (RFC 3502) extensions. Every read and write is bounded by the
+    command timeout, shortened to the deadline of the current request.
+    """
+
+    _compressor   = None
+    _decompressor = None
+
+    def __init__(self, host: str, port: int, timeout: float = 30.0, circuit: Any = None) -> None:
+        """
+        Parameters:
+        -----------
+        host: str
+            Server address.
+        port: int
+            Server port.
+        timeout: float
+            Timeout of the connection and of each command, in seconds.
+        circuit: CircuitBreaker
+            Circuit breaker of the server, told of timeouts.
+
+        Return:
+        -------
+        None
+        """
+        self.command_timeout = timeout
+        self.circuit         = circuit
+        super().__init__(host=host, port=port, timeout=timeout)
+
+    def open(self, host: str = '', port: int = imaplib.IMAP4_SSL_PORT, timeout: Optional[float] = None) -> None:
+        deadlines.guarded(None, host, self.command_timeout, self.circuit,
+                          super().open, host, port, deadlines.timeout(self.command_timeout))
+
+    def _timed(self, function: Callable, *args: Any) -> Any:
+        return deadlines.guarded(self.sock, self.host, self.command_timeout, self.circuit, function, *args)
+
+    def interrupt(self) -> None:
+        """ Abort a blocking read or write from another thread. The connection is unusable afterwards.
+        """
+        self.sock.shutdown(socket.SHUT_RDWR)
+
+    def server_capabilities(self) -> List[str]:
+        """ Capabilities advertised by the server in the current state.
+        Servers usually announce extensions such as COMPRESS only after login.
+
+        Return:
+        -------
+        capabilities: List[str]
+            Upper case capability names.
+        """
+        typ, dat = self.capability()
+        if typ != 'OK' or not dat or dat[-1] is None:
+            return list(self.capabilities)
+        return dat[-1].decode('utf-8').upper().split()
+
+    def compress(self, level: int = 6) -> bool:
+        """ Turn on DEFLATE compression of the connection, when the server supports it.
+
+        Parameters:
+        -----------
+        level: int
+            zlib compression level used for the data sent to the server.
+
+        Return:
+        -------
+        compressed: bool
+            True if the connection is compressed from now on.
+        """
+        if self._compressor is not None:
+            return True
+        if 'COMPRESS=DEFLATE' not in self.server_capabilities():
+            return False
+        typ, _ = self.xatom('COMPRESS', 'DEFLATE')
+        if typ != 'OK':
+            return False
+        self._compressor   = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        self._buffer       = b''
+        return True
+
+    def _fill(self) -> None:
+        # read1 returns what is already buffered before touching the socket, so
+        # compressed bytes read ahead together with the COMPRESS reply are kept.
+        data = self.file.read1(65536)
+        if not data:
+            raise self.abort('socket error: EOF')
+        self._buffer += self._decompressor.decompress(data)
+
+    def read(self, size: int) -> bytes:
+        return self._timed(self._read, size)
+
+    def _read(self, size: int) -> bytes:
+        if self._decompressor is None:
+            return super().read(size)
+        while len(self._buffer) < size:
+            self._fill()
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def readline(self) -> bytes:
+        return self._timed(self._readline)
+
+    def _readline(self) -> bytes:
+        if self._decompressor is None:
+            return super().readline()
+        while True:
+            end = self._buffer.find(b'\n')
+            if end >= 0:
+                break
+            if len(self._buffer) > imaplib._MAXLINE:
+                raise self.error("got more than %d bytes" % imaplib._MAXLINE)
+            self._fill()
+        line, self._buffer = self._buffer[:end + 1], self._buffer[end + 1:]
+        if len(line) > imaplib._MAXLINE:
+            raise self.error("got more than %d bytes" % imaplib._MAXLINE)
+        return line
+
+    def send(self, data: bytes) -> None:
+        if self._compressor is not None:
+            data = self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        self._timed(super().send, data)
+
+    def multiappend(self, mailbox: str, messages: List[AppendMessage],
+                    literal_plus: bool = False) -> Tuple[str, list, List[str]]:
+        """ Append messages to a mailbox with a single APPEND command, as allowed by
+        the MULTIAPPEND extension (RFC 3502). Servers without it must get one message.
+
+        Parameters:
+        -----------
+        mailbox: str
+            Destination mailbox.
+        messages: List[AppendMessage]
+            Raw message, flags and internal date of each message.
+        literal_plus: bool
+            Send the messages as non-synchronizing literals (LITERAL+, RFC 7888),
+            without waiting for the server continuation between them.
+
+        Return:
+        -------
+        typ, data, uids: Tuple[str, list, List[str]]
+            Command result and response data, and UIDs of the appended messages
+            when the server reports them with APPENDUID (UIDPLUS, RFC 4315).
+        """
+        heads: List[bytes] = []
+        literals: List[bytes] = []
+        for raw, flags, date_time in messages:
+            head = []
+            if flags:
+                head.append(bytes('(%s)' % ' '.join(flags), self._encoding))
+            if date_time is not None:
+                head.append(bytes(imaplib.Time2Internaldate(date_time), self._encoding))
+            literal = imaplib.MapCRLF.sub(imaplib.CRLF, raw)
+            head.append(bytes('{%d%s}' % (len(literal), '+' if literal_plus else ''), self._encoding))
+            heads.append(b' '.join(head))
+            literals.append(literal)
+
+        if literal_plus:
+            typ, dat = self._command_complete('APPEND', self._append_literals(mailbox, heads, literals))
+        else:
+            self.literal = _Literals(heads, literals).next
+            typ, dat = self._simple_command('APPEND', bytes(mailbox, self._encoding), heads[0])
+        appenduid = self.untagged_responses.pop('APPENDUID', [None])[-1]
+        if typ != 'OK' or appenduid is None:
+            return typ, dat, []
+        uids = []
+        for item in appenduid.decode('ascii').split()[-1].split(','):
+            match = _UID_RANGE.match(item)
+            if match:
+                uids.extend(str(uid) for uid in range(int(match.group(1)), int(match.group(2)) + 1))
+            else:
+                uids.append(item)
+        return typ, dat, uids
+
+    def _append_literals(self, mailbox: str, heads: List[bytes], literals: List[bytes]) -> bytes:
+        """ Send an APPEND of non-synchronizing literals piece by piece: imaplib
+        concatenates the arguments of a command into one string, copying every
+        literal once per argument that follows it.
+        """
+        if self.state not in imaplib.Commands['APPEND']:
+            raise self.error('command APPEND illegal in state %s' % self.state)
+        for typ in ('OK', 'NO', 'BAD'):
+            self.untagged_responses.pop(typ, None)
+        tag = self._new_tag()
+        try:
+            self.send(tag + b' APPEND ' + bytes(mailbox, self._encoding))
+            for head, literal in zip(heads, literals):
+                self.send(b' ' + head + imaplib.CRLF)
+                self.send(literal)
+            self.send(imaplib.CRLF)
+        except OSError as val:
+            raise self.abort('socket error: %s' % val)
+        return tag
+
+class _Literals:
+    """
+    Literals of a synchronizing APPEND, handed to imaplib one per continuation
+    request, each followed by the arguments of the next message up to the size
+    of its literal.
+    """
+
+    def __init__(self, heads: List[bytes], literals: List[bytes]) -> None:
+        self._heads    = heads
+        self._literals = literals
+        self._index    = 0
+
+    def next(self, continuation: bytes) -> bytes:
+        index = self._index
+        if index >= len(self._literals):
+            return b''
+        self._index += 1
+        if index + 1 < len(self._heads):
+            return self._literals[index] + b' ' + self._heads[index + 1]
+        return self._literals[index]
@@ -0,0 +1,157 @@
+""" Conversation threading: parsing of IMAP THREAD responses (RFC 5256), and
+local threading of messages headers, following Jamie Zawinski's algorithm
+(https://www.jwz.org/doc/threading.html).
+
+Threads are lists of dicts {'uid': str|None, 'depth': int}, the messages of the
+thread tree in depth-first order with their depth in it, so that reply chains of
+any length are neither recursed into nor nested. A None uid stands for a message
+referenced by the thread but absent from the mailbox.
+"""
+import re
+from email.message import Message
+from email.utils import parsedate_to_datetime
+from typing import Dict, List, Optional, Tuple
+
+_TOKENS     = re.compile(rb'\(|\)|\d+')
+_MESSAGE_ID = re.compile(r'<[^<>]+>')
+
+def _flatten(root: str, uids: Dict[str, Optional[str]], children: Dict[str, List[str]]) -> List[dict]:
+    """ Messages of a thread tree in depth-first order, with their depth.
+    """
+    nodes: List[dict] = []
+    stack = [(root, 0)]
+    while stack:
+        node, depth = stack.pop()
+        nodes.append({'uid': uids[node], 'depth': depth})
+        stack.extend((child, depth + 1) for child in reversed(children[node]))
+    return nodes
+
+def parse_thread_response(data: bytes) -> List[List[dict]]:
+    """ Parse the data of an IMAP THREAD response.
+
+    Parameters:
+    -----------
+    data: bytes
+        Response data, e.g. b'(2)(3 6 (4 23)(44 7 96))'.
+
+    Return:
+    -------
+    threads: List[List[dict]]
+        Threads, in the server order.
+    """
+    threads: List[List[dict]] = []
+    # Depth of the next message of each open list: leading numbers are a
+    # parent-child chain, and the nested lists that follow are children of
+    # its last message, or of a missing message when there is none.
+    stack: List[list] = []
+    for token in _TOKENS.findall(data or b''):
+        if token == b'(':
+            if not stack:
+                threads.append([])
+            elif not stack[-1][1]:
+                threads[-1].append({'uid': None, 'depth': stack[-1][0]})
+                stack[-1] = [stack[-1][0] + 1, True]
+            stack.append([stack[-1][0] if stack else 0, False])
+        elif token == b')':
+            if stack:
+                stack.pop()
+        elif stack:
+            threads[-1].append({'uid': token.decode('ascii'), 'depth': stack[-1][0]})
+            stack[-1] = [stack[-1][0] + 1, True]
+    return [thread for thread in threads if thread]
+
+def _message_ids(value: Optional[str]) -> List[str]:
+    return _MESSAGE_ID.findall(value or '')
+
+def _date(message: Message) -> float:
+    try:
+        return parsedate_to_datetime(message['Date']).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return 0.0
+
+def thread_messages(messages: List[Tuple[str, Message]]) -> List[List[dict]]:
+    """ Thread messages by their Message-ID, References and In-Reply-To headers.
+
+    Parameters:
+    -----------
+    messages: List[Tuple[str, Message]]
+        Pairs of message UID and parsed headers.
+
+    Return:
+    -------
+    threads: List[List[dict]]
+        Threads, ordered by the date of their first message. Siblings
+        are ordered by date.
+    """
+    uids   : Dict[str, Optional[str]] = {}
+    parents: Dict[str, Optional[str]] = {}
+    dates  : Dict[str, float] = {}
+
+    def container(message_id: str) -> None:
+        if message_id not in uids:
+            uids[message_id]    = None
+            parents[message_id] = None
+
+    def ancestor(message_id: Optional[str], other: str) -> bool:
+        while message_id is not None:
+            if message_id == other:
+                return True
+            message_id = parents[message_id]
+        return False
+
+    def link(parent: str, child: str) -> None:
+        if parents[child] is None and not ancestor(parent, child):
+            parents[child] = parent
+
+    for uid, message in messages:
+        ids = _message_ids(message['Message-ID'])
+        message_id = ids[0] if ids else f'<uid-{uid}@local>'
+        container(message_id)
+        if uids[message_id] is not None:
+            message_id = f'<uid-{uid}@local>'
+            container(message_id)
+        uids[message_id]  = uid
+        dates[message_id] = _date(message)
+
+        references  = _message_ids(message['References'])
+        in_reply_to = _message_ids(message['In-Reply-To'])
+        if in_reply_to and (not references or references[-1] != in_reply_to[0]):
+            references.append(in_reply_to[0])
+        references = [reference for reference in references if reference != message_id]
+        for reference in references:
+            container(reference)
+        for parent, child in zip(references, references[1:]):
+            link(parent, child)
+        if references:
+            # The message own references take precedence over guesses from other messages.
+            parents[message_id] = None
+            link(references[-1], message_id)
+
+    children: Dict[str, List[str]] = {message_id: [] for message_id in uids}
+    for message_id, parent in parents.items():
+        if parent is not None:
+            children[parent].append(message_id)
+    roots = [message_id for message_id, parent in parents.items() if parent is None]
+
+    order = []
+    stack = list(roots)
+    while stack:
+        message_id = stack.pop()
+        order.append(message_id)
+        stack.extend(children[message_id])
+    # Children before their parents: drop empty containers, promoting their
+    # children, and order siblings by the date of their first message.
+    kept: Dict[str, List[str]] = {}
+    for message_id in reversed(order):
+        kept[message_id] = [kept_id for child in children[message_id]
+                                for kept_id in ([child] if uids[child] is not None else kept[child])]
+        if message_id not in dates:
+            dates[message_id] = min((dates[child] for child in kept[message_id]), default=0.0)
+        kept[message_id].sort(key=dates.__getitem__)
+
+    # An empty root is kept only to hold several threads that share a missing ancestor.
+    threads = [thread for message_id in roots
+                  for thread in ([message_id] if uids[message_id] is not None or len(kept[message_id]) > 1
+                                 else kept[message_id])]
+    threads.sort(key=dates.__getitem__)
+    return [_flatten(thread, uids, kept) for thread in threads]
@@ -0,0 +1,168 @@
+import smtplib
+import socket
+from email import policy as policies
+from email.generator import BytesGenerator
+from email.message import Message
+from typing import Any, Callable, Dict, List, Tuple
+from dependencies.deadlines import deadlines
+
+class _BDATWriter:
+    """
+    File-like object sending what is written to it as BDAT chunks (RFC 3030).
+    """
+
+    def __init__(self, smtp: 'SMTP', chunk_size: int) -> None:
+        self.smtp       = smtp
+        self.chunk_size = chunk_size
+        self._buffer    = bytearray()
+
+    def write(self, data: bytes|str) -> None:
+        if isinstance(data, str):
+            data = data.encode('utf-8', 'surrogateescape')
+        self._buffer += data
+        while len(self._buffer) >= self.chunk_size:
+            self._send(bytes(self._buffer[:self.chunk_size]), last=False)
+            del self._buffer[:self.chunk_size]
+
+    def close(self) -> Tuple[int, bytes]:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return self._send(data, last=True)
+
+    def _send(self, data: bytes, last: bool) -> Tuple[int, bytes]:
+        command = 'BDAT %d%s\r\n' % (len(data), ' LAST' if last else '')
+        self.smtp.send(command.encode('ascii') + data)
+        code, resp = self.smtp.getreply()
+        if code != 250:
+            raise smtplib.SMTPDataError(code, resp)
+        return code, resp
+
+class SMTP(smtplib.SMTP):
+    """
+    smtplib.SMTP sending the envelope with PIPELINING (RFC 2920), the message
+    with CHUNKING/BDAT (RFC 3030) and international addresses with SMTPUTF8
+    (RFC 6531), when the server supports them. Every read and write is bounded
+    by the command timeout, shortened to the deadline of the current request.
+    """
+
+    def __init__(self, host: str, port: int, timeout: float = 30.0, circuit: Any = None) -> None:
+        """
+        Parameters:
+        -----------
+        host: str
+            Server address.
+        port: int
+            Server port.
+        timeout: float
+            Timeout of the connection and of each command, in seconds.
+        circuit: CircuitBreaker
+            Circuit breaker of the server, told of timeouts.
+
+        Return:
+        -------
+        None
+        """
+        self.command_timeout = timeout
+        self.circuit         = circuit
+        super().__init__(host=host, port=port, timeout=timeout)
+
+    def _get_socket(self, host: str, port: int, timeout: float) -> socket.socket:
+        return deadlines.guarded(None, host, self.command_timeout, self.circuit, super()._get_socket,
+                                 host, port, deadlines.timeout(self.command_timeout))
+
+    def _timed(self, function: Callable, *args: Any) -> Any:
+        return deadlines.guarded(getattr(self, 'sock', None), self._host, self.command_timeout,
+                                 self.circuit, function, *args)
+
+    def send(self, s: bytes|str) -> None:
+        self._timed(super().send, s)
+
+    def getreply(self) -> Tuple[int, bytes]:
+        return self._timed(super().getreply)
+
+    def interrupt(self) -> None:
+        """ Abort a blocking read or write from another thread. The connection is unusable afterwards.
+        """
+        if self.sock is not None:
+            self.sock.shutdown(socket.SHUT_RDWR)
+
+    def send_chunked(self, msg: Message, from_addr: str, to_addrs: List[str],
+                     chunk_size: int = 262144) -> Dict[str, Tuple[int, bytes]]:
+        """ Send a message, reporting the status of each recipient.
+
+        Parameters:
+        -----------
+        msg: Message
+            Message to be sent. It is serialized straight to the connection
+            when the server supports BDAT.
+        from_addr: str
+            Envelope sender.
+        to_addrs: List[str]
+            Envelope recipients.
+        chunk_size: int
+            Size of the BDAT chunks, in bytes.
+
+        Return:
+        -------
+        statuses: Dict[str, Tuple[int, bytes]]
+            SMTP reply code and message of each recipient.
+        """
+        self.ehlo_or_helo_if_needed()
+        mail_options = []
+        policy = msg.policy
+        try:
+            ''.join([from_addr, *to_addrs]).encode('ascii')
+        except UnicodeEncodeError:
+            if not self.has_extn('smtputf8'):
+                raise smtplib.SMTPNotSupportedError(
+                    "One or more source or delivery addresses require"
+                    " internationalized email support, but the server"
+                    " does not advertise the required SMTPUTF8 capability")
+            policy = policies.SMTPUTF8
+            mail_options.append('SMTPUTF8')
+            if self.has_extn('8bitmime'):
+                mail_options.append('BODY=8BITMIME')
+
+        statuses = self._envelope(from_addr, to_addrs, mail_options)
+        if all(code not in (250, 251) for code, _ in statuses.values()):
+            self._rset()
+            raise smtplib.SMTPRecipientsRefused(statuses)
+
+        if self.has_extn('chunking'):
+            writer = _BDATWriter(self, chunk_size)
+            try:
+                BytesGenerator(writer, policy=policy).flatten(msg, linesep='\r\n')
+                writer.close()
+            except smtplib.SMTPDataError:
+                self._rset()
+                raise
+        else:
+            code, resp = self.data(msg.as_bytes(policy=policy.clone(linesep='\r\n')))
+            if code != 250:
+                self._rset()
+                raise smtplib.SMTPDataError(code, resp)
+        return statuses
+
+    def _envelope(self, from_addr: str, to_addrs: List[str],
+                  mail_options: List[str]) -> Dict[str, Tuple[int, bytes]]:
+        """ Send MAIL FROM and RCPT TO, in a single write when the server supports
+        PIPELINING, and return the status of each recipient.
+        """
+        if not self.has_extn('pipelining'):
+            code, resp = self.mail(from_addr, mail_options)
+            if code != 250:
+                self._rset()
+                raise smtplib.SMTPSenderRefused(code, resp, from_addr)
+            return {to_addr: self.rcpt(to_addr) for to_addr in to_addrs}
+
+        options = ''.join(' ' + option for option in mail_options)
+        commands = ['mail FROM:%s%s' % (smtplib.quoteaddr(from_addr), options)]
+        commands.extend('rcpt TO:%s' % smtplib.quoteaddr(to_addr) for to_addr in to_addrs)
+        encoding = 'utf-8' if 'SMTPUTF8' in mail_options else 'ascii'
+        self.send(''.join(command + '\r\n' for command in commands).encode(encoding))
+        code, resp = self.getreply()
+        replies = {to_addr: self.getreply() for to_addr in to_addrs}
+        if code != 250:
+            self._rset()
+            raise smtplib.SMTPSenderRefused(code, resp, from_addr)
+        return replies
@@ -0,0 +1,113 @@
+import json
+from typing import Any, Iterable, Iterator, Optional
+from fastapi import Response
+from fastapi.responses import StreamingResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON    = 'application/json'
+NDJSON  = 'application/x-ndjson'
+MSGPACK = 'application/msgpack'
+
+_MEDIA_TYPES = {
+    JSON                  : JSON,
+    NDJSON                : NDJSON,
+    'application/jsonl'   : NDJSON,
+    MSGPACK               : MSGPACK,
+    'application/x-msgpack': MSGPACK,
+}
+
+def dumps(content: Any) -> bytes:
+    """ Serialize content to JSON bytes, with orjson when it is installed.
+    """
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, separators=(',', ':')).encode('utf-8')
+
+def negotiate(accept: Optional[str]) -> str:
+    """ Pick the response media type from an Accept header.
+
+    Parameters:
+    -----------
+    accept: Optional[str]
+        Accept header value.
+
+    Return:
+    -------
+    media_type: str
+        Supported media type with the highest q value, the first listed among
+        equals, JSON if none is accepted. msgpack is only offered when the
+        msgpack package is installed.
+    """
+    best, best_q = JSON, 0.0
+    for item in (accept or '').split(','):
+        name, *params = [value.strip() for value in item.split(';')]
+        media_type = _MEDIA_TYPES.get(name.lower())
+        if media_type is None or (media_type == MSGPACK and msgpack is None):
+            continue
+        q = 1.0
+        for param in params:
+            if param.startswith('q='):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if q > best_q:
+            best, best_q = media_type, q
+    return best
+
+NDJSON_CHUNK_SIZE = 65536
+
+def ndjson_lines(items: Iterable) -> Iterator[bytes]:
+    """ Yield one JSON line per item, as items are produced. Items of a list,
+    already available, are grouped in chunks of about NDJSON_CHUNK_SIZE bytes.
+    """
+    if not isinstance(items, (list, tuple)):
+        for item in items:
+            yield dumps(item) + b'\n'
+        return
+    chunk = bytearray()
+    for item in items:
+        chunk += dumps(item) + b'\n'
+        if len(chunk) >= NDJSON_CHUNK_SIZE:
+            yield bytes(chunk)
+            chunk.clear()
+    if chunk:
+        yield bytes(chunk)
+
+def render(content: Any, accept: Optional[str], key: Optional[str] = None) -> Response:
+    """ Build the response for data the API produced itself, skipping the
+    response_model validation and the default JSON encoder.
+
+    Parameters:
+    -----------
+    content: Any
+        Response content. When `key` is given, an iterable of items.
+    accept: Optional[str]
+        Accept header of the request.
+    key: Optional[str]
+        Name under which the items are wrapped on JSON and msgpack responses,
+        e.g. 'uids' gives {"uids": [...]}. NDJSON responses stream the items
+        one per line, without the wrapper.
+
+    Return:
+    -------
+    response: Response
+    """
+    media_type = negotiate(accept)
+    if media_type == NDJSON:
+        items = content if key is not None else [content]
+        return StreamingResponse(ndjson_lines(items), media_type=NDJSON)
+    if key is not None:
+        content = {key: list(content)}
+    if media_type == MSGPACK:
+        return Response(msgpack.packb(content), media_type=MSGPACK)
+    return Response(dumps(content), media_type=JSON)
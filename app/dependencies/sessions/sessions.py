@@ -0,0 +1,101 @@
+import secrets
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+class Session:
+    """
+    Server-side account context behind a session token.
+    """
+
+    def __init__(self, token: str, mail: Any, capabilities: List[str], ttl: int) -> None:
+        """
+        Parameters:
+        -----------
+        token: str
+            Opaque session token.
+        mail: email
+            Email client of the account, holding its servers and idle IMAP connections.
+        capabilities: List[str]
+            IMAP capabilities advertised by the server after login.
+        ttl: int
+            Session lifetime, in seconds.
+
+        Return:
+        -------
+        None
+        """
+        self.token        = token
+        self.mail         = mail
+        self.capabilities = capabilities
+        self.expires_at   = time.monotonic() + ttl
+
+    @property
+    def expires_in(self) -> int:
+        return max(0, int(self.expires_at - time.monotonic()))
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+class SessionStore:
+    """
+    In-memory, thread safe, map of session tokens to account contexts.
+    """
+
+    def __init__(self) -> None:
+        self._sessions: Dict[str, Session] = {}
+        self._lock = threading.Lock()
+
+    def create(self, mail: Any, capabilities: List[str], ttl: int) -> Session:
+        """ Open a session for an account whose credentials were validated.
+
+        Parameters:
+        -----------
+        mail: email
+            Email client of the account.
+        capabilities: List[str]
+            IMAP capabilities of the account server.
+        ttl: int
+            Session lifetime, in seconds.
+
+        Return:
+        -------
+        session: Session
+        """
+        self._purge()
+        session = Session(secrets.token_urlsafe(32), mail, capabilities, ttl)
+        with self._lock:
+            self._sessions[session.token] = session
+        return session
+
+    def get(self, token: str) -> Optional[Session]:
+        """ Session of a token, or None when it is unknown or expired.
+        """
+        self._purge()
+        with self._lock:
+            return self._sessions.get(token)
+
+    def delete(self, token: str) -> bool:
+        """ Close a session and its IMAP connections.
+
+        Return:
+        -------
+        deleted: bool
+            False when the token is unknown or expired.
+        """
+        with self._lock:
+            session = self._sessions.pop(token, None)
+        if session is None:
+            return False
+        session.mail.close()
+        return True
+
+    def _purge(self) -> None:
+        with self._lock:
+            expired = [session for session in self._sessions.values() if session.expired()]
+            for session in expired:
+                del self._sessions[session.token]
+        for session in expired:
+            session.mail.close()
+
+store = SessionStore()
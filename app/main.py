@@ -1,18 +1,62 @@
-from fastapi import FastAPI
-from routers import emails
-from dependencies.doc.doc import generate_documentation_HTML
-import uvicorn
-import socket  
-hostname=socket.gethostname()   
-IPAddr=socket.gethostbyname(hostname)
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from routers import emails, health
+from dependencies.doc.doc import cached_openapi
+from dependencies.compression.compression import CompressionMiddleware
+from dependencies.deadlines.deadlines import Cancelled, DeadlineExceeded, DeadlineMiddleware
+from dependencies.circuits.circuits import CircuitOpen
+from dependencies.config import config
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    asyncio.get_running_loop().run_in_executor(None, health.warm_up)
+    yield
 
 app = FastAPI(
-    description= """MICROSERVICE FOR EMAIL MANAGEMENT."""
+    description= """MICROSERVICE FOR EMAIL MANAGEMENT.""",
+    lifespan=lifespan
 )
 app.include_router(
     emails.router
 )
+app.include_router(
+    health.router
+)
+app.add_middleware(
+    DeadlineMiddleware,
+    default= config.REQUEST_DEADLINE,
+    routes = {
+        '/email/messages/export': config.TRANSFER_DEADLINE,
+        '/email/messages/import': config.TRANSFER_DEADLINE,
+        }
+)
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size  = config.HTTP_COMPRESS_MINIMUM_SIZE,
+    gzip_level    = config.HTTP_GZIP_LEVEL,
+    brotli_quality= config.HTTP_BROTLI_QUALITY
+)
+app.openapi = cached_openapi(app)
+
+@app.exception_handler(DeadlineExceeded)
+def deadline_exceeded(request: Request, error: DeadlineExceeded):
+    return JSONResponse(status_code=504, content={'detail': str(error)})
+
+@app.exception_handler(CircuitOpen)
+def circuit_open(request: Request, error: CircuitOpen):
+    return JSONResponse(status_code=503, content={'detail': str(error)},
+                        headers={'Retry-After': str(int(error.retry_after))})
+
+@app.exception_handler(Cancelled)
+def cancelled(request: Request, error: Cancelled):
+    # Nobody reads it: the client is gone.
+    return JSONResponse(status_code=499, content={'detail': str(error)})
 
 if __name__ == '__main__':
-    generate_documentation_HTML(app)
-    uvicorn.run(app, host=IPAddr, port=8000)
\ No newline at end of file
+    import socket
+    import uvicorn
+    hostname=socket.gethostname()
+    IPAddr=socket.gethostbyname(hostname)
+    uvicorn.run(app, host=IPAddr, port=8000)
@@ -1,28 +1,34 @@
 from pydantic import BaseModel, Field
-from typing import Optional,Dict, List
+from typing import Optional,Dict, List, Literal
 
 class Attachment(BaseModel):
     filename: str = Field(..., 
                         description='Filename with extension.'
                         )
-    encoding: str = Field(...,
+    encoding: Optional[str] = Field(default=None,
                         description="Protocol used to decode file bytes to string."
                         )
-    file    : str = Field(...,
+    file    : Optional[str] = Field(default=None,
                         description="File bytes converted to string."
                         )
+    sha256  : Optional[str] = Field(default=None,
+                        description="SHA-256 of a file uploaded to POST /email/attachments, "
+                                    "used instead of 'file' and 'encoding'."
+                        )
 
 class Server(BaseModel):
     host: str
     port: str
 
 class EmailCredentials(BaseModel):
-    login        : str = Field(..., 
-                        description="Email account login in a email provider."
+    login        : Optional[str] = Field(default=None, 
+                        description="Email account login in a email provider. "
+                                    "Not needed when a session token is given."
                         )
 
-    password     : str = Field(..., 
-                        description="Application password for the email account."
+    password     : Optional[str] = Field(default=None, 
+                        description="Application password for the email account. "
+                                    "Not needed when a session token is given."
                         )
 
     smtp_server: Optional[Server] = Field(default={"host":"smtp.gmail.com", "port":"587"},
@@ -33,6 +39,20 @@ class EmailCredentials(BaseModel):
                         description="Address and port of the IMAP server from email provider."
                         )
     
+class SessionCreate(EmailCredentials):
+    login        : str = Field(..., 
+                        description="Email account login in a email provider."
+                        )
+
+    password     : str = Field(..., 
+                        description="Application password for the email account."
+                        )
+
+    ttl          : Optional[int] = Field(default=None, gt=0,
+                        description="Session lifetime in seconds. Defaults to the service "
+                                    "setting, and is capped by its maximum."
+                        )
+
 class EmailSend(EmailCredentials):
 
     sender      : str = Field(..., 
@@ -78,6 +98,8 @@ class EmailSend(EmailCredentials):
             'File bytes converted to string'
         }
     ].
+    Instead of 'encoding' and 'file', an attachment can give the 'sha256'
+    of a file uploaded to POST /email/attachments.
                         """
                         )
 
@@ -105,6 +127,29 @@ class GetEmailsUIDsForm(EmailCredentials):
     criterias: Dict[str,str] = Field(..., 
     description="""Dict with search criterias as specified in RFC 3501 (https://www.rfc-editor.org/rfc/rfc3501#section-6.4.4). You must put the criteria keys as the dictionary keys, end the key parameter as the values.""")
 
+class SearchMailboxesForm(EmailCredentials):
+    mailboxes: str|List[str] = Field(default='all',
+    description="List of mailboxes paths to search, or 'all' to search every selectable mailbox.")
+    criterias: Dict[str,str] = Field(..., 
+    description="""Dict with search criterias as specified in RFC 3501 (https://www.rfc-editor.org/rfc/rfc3501#section-6.4.4). You must put the criteria keys as the dictionary keys, end the key parameter as the values.""")
+
+class GetThreadsForm(EmailCredentials):
+    mailbox  : str = Field(..., description='Mailbox path.')
+    criterias: Dict[str,str] = Field(default={'ALL': ''}, 
+    description="""Dict with search criterias as specified in RFC 3501 (https://www.rfc-editor.org/rfc/rfc3501#section-6.4.4). You must put the criteria keys as the dictionary keys, end the key parameter as the values.""")
+    page     : int = Field(default=1, ge=1, description='Page number, starting at 1.')
+    page_size: int = Field(default=50, ge=1, le=1000, description='Threads per page.')
+
+class ExportMailboxForm(EmailCredentials):
+    mailbox   : str = Field(..., description='Mailbox path.')
+    criterias : Dict[str,str] = Field(default={'ALL': ''}, 
+    description="""Dict with search criterias as specified in RFC 3501 (https://www.rfc-editor.org/rfc/rfc3501#section-6.4.4). You must put the criteria keys as the dictionary keys, end the key parameter as the values.""")
+    format    : Literal['mbox', 'eml'] = Field(default='mbox', 
+                        description="'mbox' for a mbox file (mboxrd), 'eml' for a tar "
+                                    "archive of '<uid>.eml' files.")
+    batch_size: int = Field(default=50, ge=1, le=1000, 
+                        description='Messages fetched from the server at a time.')
+
 class PutEmailsMove(EmailCredentials):
     from_box: str = Field(...,description='Mailbox path of the message to be moved.')
     uid     : str = Field(...,description='UID of the message to be moved.')
@@ -145,6 +190,8 @@ class PutReplyEmails(EmailCredentials):
                 'File bytes converted to string'
             }
         ].
+        Instead of 'encoding' and 'file', an attachment can give the 'sha256'
+        of a file uploaded to POST /email/attachments.
                             """
                             )
 
@@ -174,7 +221,19 @@ class deleteMailboxDelete(EmailCredentials):
                          'Path of the mailbox to be deleted, with name.')
 
 class Send_post_response_model(BaseModel):
-    errors: dict[str, tuple[int, bytes]]
+    errors    : dict[str, tuple[int, bytes]] = Field(..., 
+                        description="SMTP reply code and message of the refused recipients.")
+    recipients: dict[str, tuple[int, bytes]] = Field(default={}, 
+                        description="SMTP reply code and message of each recipient.")
+
+class Session_post_response_model(BaseModel):
+    token       : str = Field(..., description="Session token, to be sent on the X-Session-Token header.")
+    expires_in  : int = Field(..., description="Seconds until the session expires.")
+    capabilities: List[str] = Field(..., description="IMAP capabilities of the account server.")
+
+class Attachment_post_response_model(BaseModel):
+    sha256: str = Field(..., description="SHA-256 of the file, to reference it on attachments.")
+    size  : int = Field(..., description="File size in bytes.")
 
 class Mailboxes_get_response_model(BaseModel):
     mailboxes: List[str] = Field(..., description="Mailboxes paths.")
@@ -182,6 +241,27 @@ class Mailboxes_get_response_model(BaseModel):
 class UIDs_get_response_model(BaseModel):
     uids: List[str] = Field(..., description="Email messages UIDs.")
 
+class Search_get_response_model(BaseModel):
+    results: Dict[str, List[str]] = Field(..., description="Email messages UIDs by mailbox path.")
+    errors : Dict[str, str]       = Field(..., description="Errors of the mailboxes that could not be searched, by mailbox path.")
+
+class ThreadMessage(BaseModel):
+    uid  : Optional[str] = Field(..., description='Email message UID. Null for a message '
+                                                  'referenced by the thread but not in the mailbox.')
+    depth: int = Field(..., description='Depth of the message in the thread tree: 0 for the first '
+                                        'message, and one more than the message it replies to.')
+
+class Threads_get_response_model(BaseModel):
+    threads: List[List[ThreadMessage]] = Field(..., description="Threads, as the email messages UIDs of their tree in depth-first order.")
+    total  : int = Field(..., description="Number of threads in the mailbox for the given criterias.")
+    page   : int = Field(..., description="Page number.")
+
+class Import_post_response_model(BaseModel):
+    imported: int = Field(..., description="Number of messages appended to the mailbox.")
+    uids    : List[str] = Field(..., description="UIDs of the appended messages, when the "
+                                                 "server reports them (UIDPLUS).")
+    error   : Optional[str] = Field(default=None, description="Server error that stopped the import.")
+
 class Move_put_desponse_model(BaseModel):
     copy_response: str
     delete_response: str
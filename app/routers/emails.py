@@ -1,100 +1,278 @@
 import pathlib
-from fastapi import APIRouter
-from dependencies.emails.emails import email
+import re
+from fastapi import APIRouter, Form, Header, HTTPException, UploadFile
+from fastapi.responses import StreamingResponse
+from dependencies.attachments import attachments
+from dependencies.config import config
+from dependencies.responses.responses import NDJSON, negotiate, render
+from dependencies.sessions import sessions
 from models.emails import *
 
 router = APIRouter(
     prefix='/email',
     )
 
+def _email(request_json: dict, session: Optional[str]):
+    """ Get the `email` client of a request: the one of its session when a
+    session token is given, a new one built from its credentials otherwise.
+    The mail stack is imported on first use so that it stays off the startup path.
+    """
+    if session is not None:
+        context = sessions.store.get(session)
+        if context is None:
+            raise HTTPException(status_code=401, detail='Invalid or expired session token.')
+        return context.mail
+    if request_json.get('login') is None or request_json.get('password') is None:
+        raise HTTPException(status_code=401, 
+                            detail='Missing credentials: give login and password, or a session token.')
+    from dependencies.emails.emails import email
+    return email(
+        login      = request_json['login'],
+        password   = request_json['password'],
+        smtp_server= request_json['smtp_server'],
+        imap_server= request_json['imap_server']
+        )
+
+def _owner(mail) -> str:
+    """ Identity of the account of an `email` client, owning its uploaded attachments.
+    """
+    return '\0'.join(mail.account)
+
+def _attachments(attachments_list: Optional[List[dict]], mail) -> Optional[List[dict]]:
+    """ Resolve attachments given by SHA-256 to the base64 payload the account uploaded.
+    """
+    if attachments_list is None:
+        return None
+    for attachment in attachments_list:
+        if attachment.get('sha256') is not None:
+            payload = attachments.store.get(attachment['sha256'], _owner(mail))
+            if payload is None:
+                raise HTTPException(status_code=404, 
+                                    detail=f"Unknown attachment {attachment['sha256']}, upload it again.")
+            attachment['payload'] = payload
+        elif attachment.get('file') is None or attachment.get('encoding') is None:
+            raise HTTPException(status_code=422, 
+                                detail="Attachments need either a 'sha256', or a 'file' and its 'encoding'.")
+    return attachments_list
+
+def _send_response(statuses: dict) -> dict:
+    """ Response of a send: the recipients refused by the server, and the status of all of them.
+    """
+    errors = {recipient: status for recipient, status in statuses.items() 
+                                if status[0] not in (250, 251)}
+    return {"errors": errors, "recipients": statuses}
+
+ACCEPT = Header(default=None,
+                description="Response format: 'application/json' (default), "
+                            "'application/x-ndjson' to stream list items one per line, "
+                            "or 'application/msgpack' when msgpack is installed.")
+
+SESSION = Header(default=None, alias='X-Session-Token',
+                 description="Session token from POST /email/sessions, used instead of "
+                             "the login and password.")
+
+@router.post('/sessions',
+             response_model= Session_post_response_model,
+             description="Validate credentials once and open a session. The returned token "
+                         "can be sent on the X-Session-Token header of every route instead "
+                         "of the login and password."
+    )
+def create_session(Request: SessionCreate):
+    import imaplib
+    from dependencies.emails.emails import email
+    request_json = Request.dict()
+    mail = email(
+        login      = request_json['login'],
+        password   = request_json['password'],
+        smtp_server= request_json['smtp_server'],
+        imap_server= request_json['imap_server'],
+        keep_alive = config.SESSION_KEEP_ALIVE
+        )
+    try:
+        capabilities = mail.capabilities()
+    except imaplib.IMAP4.error:
+        raise HTTPException(status_code=401, detail='Login failed.')
+    ttl = min(request_json['ttl'] or config.SESSION_TTL, config.SESSION_MAX_TTL)
+    session = sessions.store.create(mail, capabilities, ttl)
+    return {
+        'token'       : session.token,
+        'expires_in'  : session.expires_in,
+        'capabilities': session.capabilities
+        }
+
+
+@router.delete('/sessions',
+               status_code=204,
+               description="Close a session and its connections."
+    )
+def delete_session(session: str = SESSION):
+    if session is None or not sessions.store.delete(session):
+        raise HTTPException(status_code=404, detail='Unknown session token.')
+
+
+@router.post('/attachments',
+             response_model= Attachment_post_response_model,
+             description="Upload an attachment once, to reference it by SHA-256 on send and "
+                         "reply requests. Requires a session token."
+    )
+def upload_attachment(file: UploadFile, session: Optional[str] = SESSION):
+    context = sessions.store.get(session) if session is not None else None
+    if context is None:
+        raise HTTPException(status_code=401, detail='Invalid or expired session token.')
+    try:
+        sha256, size = attachments.store.put(file.file, _owner(context.mail))
+    except attachments.AttachmentTooLarge as error:
+        raise HTTPException(status_code=413, detail=str(error))
+    return {'sha256': sha256, 'size': size}
+
+
 @router.post('/messages',
              response_model= Send_post_response_model, 
              description="Send a email."
     )
-async def send_message(request: EmailSend):
+def send_message(request: EmailSend, session: Optional[str] = SESSION):
     request_json = request.dict()
 
-    mail = email(
-        login       =request_json['login'],
-        password    =request_json['password'],
-        smtp_server =request_json['smtp_server'],
-        imap_server =request_json['imap_server']
-        )
-    response = {"errors": mail.send_email(
-                            sender      =request_json['sender'],
-                            recipients  =request_json['recipients'],
-                            Cc          =request_json['Cc'],
-                            subject     =request_json['subject'],
-                            body        =request_json['body'],
-                            body_type   =request_json['body_type'],
-                            attachments =request_json['attachments']
-                            )
-                        }
-    return response
+    mail = _email(request_json, session)
+    statuses = mail.send_email(
+                sender      =request_json['sender'],
+                recipients  =request_json['recipients'],
+                Cc          =request_json['Cc'],
+                subject     =request_json['subject'],
+                body        =request_json['body'],
+                body_type   =request_json['body_type'],
+                attachments =_attachments(request_json['attachments'], mail)
+                )
+    return _send_response(statuses)
 
 @router.get('/mailboxes',
              response_model= Mailboxes_get_response_model, 
              description="Get mailboxes."
     )
-def get_mailboxes(Request: EmailCredentials):
-    request_json = Request.dict()
-    mail = email(
-        login       =request_json['login'],
-        password    =request_json['password'],
-        smtp_server =request_json['smtp_server'],
-        imap_server =request_json['imap_server']
-        )
-    response = {"mailboxes": mail.get_mailboxes()}
-    return response
+def get_mailboxes(Request: Optional[EmailCredentials] = None, accept: Optional[str] = ACCEPT, session: Optional[str] = SESSION):
+    request_json = Request.dict() if Request is not None else {}
+    mail = _email(request_json, session)
+    return render(mail.get_mailboxes(), accept, key='mailboxes')
 
 
 @router.get('/messages/uids',
             response_model=UIDs_get_response_model,
             description='Get UIDs of email messages attending given criteria.')
-def get_messages_UIDs(Request: GetEmailsUIDsForm):
+def get_messages_UIDs(Request: GetEmailsUIDsForm, accept: Optional[str] = ACCEPT, session: Optional[str] = SESSION):
     request_json = Request.dict()
-    mail = email(
-        login      = request_json['login'],
-        password   = request_json['password'],
-        smtp_server= request_json['smtp_server'],
-        imap_server= request_json['imap_server']
-    )
-    response = {
-        'uids': mail.get_emails_uids(
-                    mailbox= request_json['mailbox'],
-                    criterias_dict= request_json['criterias']
-                    )
-        }
-    return response
+    mail = _email(request_json, session)
+    uids = mail.get_emails_uids(
+                mailbox= request_json['mailbox'],
+                criterias_dict= request_json['criterias']
+                )
+    return render(uids, accept, key='uids')
+
+
+@router.get('/messages/search',
+            response_model=Search_get_response_model,
+            description='Search email messages UIDs in several mailboxes at once. '
+                        "With 'application/x-ndjson', each mailbox is streamed as "
+                        'a {"mailbox": ..., "uids": [...]} line as soon as its search completes.')
+def search_messages(Request: SearchMailboxesForm, accept: Optional[str] = ACCEPT, session: Optional[str] = SESSION):
+    request_json = Request.dict()
+    mail = _email(request_json, session)
+    results = mail.search_mailboxes(
+                mailboxes     = request_json['mailboxes'],
+                criterias_dict= request_json['criterias'],
+                connections   = config.SEARCH_CONNECTIONS
+                )
+    if negotiate(accept) == NDJSON:
+        return render(({'mailbox': mailbox, 'uids': uids} if error is None else {'mailbox': mailbox, 'error': error}
+                          for mailbox, uids, error in results),
+                      accept, key='results')
+    found, errors = {}, {}
+    for mailbox, uids, error in results:
+        if error is None:
+            found[mailbox] = uids
+        else:
+            errors[mailbox] = error
+    return render({'results': found, 'errors': errors}, accept)
+
+
+@router.get('/threads',
+            response_model=Threads_get_response_model,
+            description='Get conversation threads as email messages UIDs in depth-first order, '
+                        'with their depth in the thread tree, '
+                        'paginated. Uses the server THREAD=REFERENCES extension when '
+                        'available, and threads the messages headers otherwise.')
+def get_threads(Request: GetThreadsForm, accept: Optional[str] = ACCEPT, session: Optional[str] = SESSION):
+    request_json = Request.dict()
+    mail = _email(request_json, session)
+    threads = mail.get_threads(
+                mailbox= request_json['mailbox'],
+                criterias_dict= request_json['criterias']
+                )
+    start = (request_json['page'] - 1) * request_json['page_size']
+    page = threads[start:start + request_json['page_size']]
+    if negotiate(accept) == NDJSON:
+        return render(page, accept, key='threads')
+    return render({'threads': page, 'total': len(threads), 'page': request_json['page']}, accept)
 
 
 @router.get('/messages',
             response_model=EmailMessage,
             description='Get email message, given mailbox path and message UID.')
-def get_message(Request: EmailUID):
+def get_message(Request: EmailUID, accept: Optional[str] = ACCEPT, session: Optional[str] = SESSION):
     request_json = Request.dict()
-    mail = email(
-        login      = request_json['login'],
-        password   = request_json['password'],
-        smtp_server= request_json['smtp_server'],
-        imap_server= request_json['imap_server']
-        )
+    mail = _email(request_json, session)
     response = mail.get_email(request_json['uid'], request_json['mailbox'])
 
-    return response
+    return render(response, accept)
+
+
+@router.get('/messages/export',
+            response_class=StreamingResponse,
+            responses={200: {'content': {'application/mbox': {}, 'application/x-tar': {}}}},
+            description='Export the messages of a mailbox, optionally filtered by search '
+                        'criterias, as a mbox file or a tar archive of .eml files. The raw '
+                        'messages are streamed as they are fetched from the server.')
+def export_messages(Request: ExportMailboxForm, session: Optional[str] = SESSION):
+    from dependencies.emails import archive
+    request_json = Request.dict()
+    mail = _email(request_json, session)
+    messages = mail.export_messages(
+                mailbox= request_json['mailbox'],
+                criterias_dict= request_json['criterias'],
+                batch_size= request_json['batch_size']
+                )
+    if request_json['format'] == 'eml':
+        chunks, media_type, extension = archive.eml_tar(messages), 'application/x-tar', 'tar'
+    else:
+        chunks, media_type, extension = archive.mbox(messages), 'application/mbox', 'mbox'
+    filename = re.sub(r'[^\w.-]+', '_', request_json['mailbox']) + '.' + extension
+    return StreamingResponse(chunks, media_type=media_type, 
+                             headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+
+@router.post('/messages/import',
+            response_model=Import_post_response_model,
+            description='Import messages into a mailbox, from a mbox file, or from NDJSON lines '
+                        '{"message": <base64 raw message>, "flags": [...], "internal_date": ...}. '
+                        'Messages are appended in batches over one connection, with MULTIAPPEND '
+                        'and LITERAL+ when the server supports them. Requires a session token.')
+def import_messages(file: UploadFile,
+                    mailbox: str = Form(..., description='Destination mailbox path.'),
+                    format: Literal['mbox', 'ndjson'] = Form(default='mbox', description='File format.'),
+                    batch_size: int = Form(default=50, ge=1, le=1000, 
+                                           description='Messages appended by each APPEND command.'),
+                    session: Optional[str] = SESSION):
+    from dependencies.emails import archive
+    mail = _email({}, session)
+    messages = archive.read_ndjson(file.file) if format == 'ndjson' else archive.read_mbox(file.file)
+    return mail.import_messages(mailbox, messages, batch_size)
 
 
 @router.put('/messages/move',
             response_model=Move_put_desponse_model,
             description='Move email message from one mailbox to another.')
-def move_message(Request: PutEmailsMove):
+def move_message(Request: PutEmailsMove, session: Optional[str] = SESSION):
     request_json = Request.dict()
-    mail = email(
-        login      = request_json['login'],
-        password   = request_json['password'],
-        smtp_server= request_json['smtp_server'],
-        imap_server= request_json['imap_server']
-        )
+    mail = _email(request_json, session)
     response = mail.move_email(
         from_box=request_json['from_box'],
         uid=request_json['uid'],
@@ -106,14 +284,9 @@ def move_message(Request: PutEmailsMove):
 @router.delete('/messages',
             response_model=Emails_delete_desponse_model,
             description='Delete email message.')
-def delete_message(Request: DeleteEmails):
+def delete_message(Request: DeleteEmails, session: Optional[str] = SESSION):
     request_json = Request.dict()
-    mail = email(
-        login      = request_json['login'],
-        password   = request_json['password'],
-        smtp_server= request_json['smtp_server'],
-        imap_server= request_json['imap_server']
-        )
+    mail = _email(request_json, session)
     response = mail.delete_email(
         mailbox=request_json['mailbox'],
         uid=request_json['uid'],
@@ -124,58 +297,41 @@ def delete_message(Request: DeleteEmails):
 @router.put('/messages',
             response_model=Send_post_response_model,
             description='Reply email message.')
-def reply_message(Request:PutReplyEmails):
+def reply_message(Request:PutReplyEmails, session: Optional[str] = SESSION):
     request_json = Request.dict()
-    mail = email(
-        login      = request_json['login'],
-        password   = request_json['password'],
-        smtp_server= request_json['smtp_server'],
-        imap_server= request_json['imap_server']
-        )
-    response = {"errors": mail.reply_email(
-                            mailbox     = request_json['mailbox'],
-                            uid         = request_json['uid'],
-                            sender      = request_json['sender'],
-                            body        = request_json['body'],
-                            body_type   = request_json['body_type'],
-                            attachments = request_json['attachments']
-                            )
-                    }
-    return response
+    mail = _email(request_json, session)
+    statuses = mail.reply_email(
+                mailbox     = request_json['mailbox'],
+                uid         = request_json['uid'],
+                sender      = request_json['sender'],
+                body        = request_json['body'],
+                body_type   = request_json['body_type'],
+                attachments = _attachments(request_json['attachments'], mail)
+                )
+    return _send_response(statuses)
 
 @router.post('/messages/forward',
             response_model=Send_post_response_model,
             description='Forward email message.')
-def forward_message(Request:PostForwardMessages):
+def forward_message(Request:PostForwardMessages, session: Optional[str] = SESSION):
     request_json = Request.dict()
-    mail = email(
-        login      = request_json['login'],
-        password   = request_json['password'],
-        smtp_server= request_json['smtp_server'],
-        imap_server= request_json['imap_server']
-        )
-    response = {"errors": mail.forward(
-                            mailbox     = request_json['mailbox'],
-                            uid         = request_json['uid'],
-                            sender      = request_json['sender'],
-                            recipients  = request_json['recipients']
-                            )
-                    }
-    return response
+    mail = _email(request_json, session)
+    statuses = mail.forward(
+                mailbox     = request_json['mailbox'],
+                uid         = request_json['uid'],
+                sender      = request_json['sender'],
+                recipients  = request_json['recipients']
+                )
+    return _send_response(statuses)
 
 
 @router.post('/mailboxes',
              response_model= MailboxPut_response_model, 
              description="Create mailbox."
     )
-def create_mailbox(Request: postMailboxCreate):
+def create_mailbox(Request: postMailboxCreate, session: Optional[str] = SESSION):
     request_json = Request.dict()
-    mail = email(
-        login       =request_json['login'],
-        password    =request_json['password'],
-        smtp_server =request_json['smtp_server'],
-        imap_server =request_json['imap_server']
-        )
+    mail = _email(request_json, session)
     response = {"response": mail.mailbox_create(request_json['new_mailbox'])}
     return response
 
@@ -184,14 +340,9 @@ def create_mailbox(Request: postMailboxCreate):
              response_model= MailboxPut_response_model, 
              description="Delete mailbox."
     )
-def delete_mailbox(Request: deleteMailboxDelete):
+def delete_mailbox(Request: deleteMailboxDelete, session: Optional[str] = SESSION):
     request_json = Request.dict()
-    mail = email(
-        login       =request_json['login'],
-        password    =request_json['password'],
-        smtp_server =request_json['smtp_server'],
-        imap_server =request_json['imap_server']
-        )
+    mail = _email(request_json, session)
     response = {"response": mail.mailbox_delete(request_json['mailbox'])}
     return response
 
@@ -200,14 +351,9 @@ def delete_mailbox(Request: deleteMailboxDelete):
              response_model= MailboxPut_response_model, 
              description="Rename mailbox."
     )
-def rename_mailbox(Request: putMailboxRename):
+def rename_mailbox(Request: putMailboxRename, session: Optional[str] = SESSION):
     request_json = Request.dict()
-    mail = email(
-        login       =request_json['login'],
-        password    =request_json['password'],
-        smtp_server =request_json['smtp_server'],
-        imap_server =request_json['imap_server']
-        )
+    mail = _email(request_json, session)
     response = {"response": mail.mailbox_rename(
                         request_json['old_mailbox'],request_json['new_mailbox'])}
     return response
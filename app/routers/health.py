@@ -0,0 +1,40 @@
+import threading
+from importlib import import_module
+from fastapi import APIRouter, Response
+from dependencies.compression.compression import compression_metrics
+from dependencies.coalescing.coalescing import flights
+from dependencies.circuits.circuits import circuits
+
+router = APIRouter(
+    prefix='/health',
+    )
+
+_ready = threading.Event()
+
+def warm_up() -> None:
+    """ Import the mail stack (smtplib, imaplib, email.mime) off the request
+    path. Readiness is reported once it is loaded.
+    """
+    import_module('dependencies.emails.emails')
+    _ready.set()
+
+@router.get('/live',
+            description='Liveness probe. Answers as soon as the server is serving requests.')
+def live():
+    return {"status": "alive"}
+
+@router.get('/ready',
+            description='Readiness probe. Answers 503 until the mail stack is loaded.')
+def ready(response: Response):
+    if not _ready.is_set():
+        response.status_code = 503
+        return {"status": "starting"}
+    return {"status": "ready"}
+
+@router.get('/metrics',
+            description='Service counters, such as bytes saved by HTTP response compression '
+                        'and IMAP reads shared by identical requests, and the mail servers '
+                        'whose circuit breaker is open.')
+def metrics():
+    return {"compression": compression_metrics(), "coalescing": flights.metrics(),
+            "circuits": circuits.metrics()}